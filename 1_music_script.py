@@ -3,9 +3,45 @@
 # виде: [имя исполнителя] - [название трека] - [название альбома].
 # Команда в консоли: python 1_music_script.py C:\Users\korol\Downloads\music
 import os
+import io
+import sys
+import csv
+import codecs
+import re
+import json
+import math
+import platform
+import tempfile
+import asyncio
+import cProfile
+import pstats
+import difflib
+import fnmatch
+import random
+import time
+import sqlite3
+import threading
 import argparse
+import queue
 import chardet
-from typing import Dict, Optional, Tuple
+import numpy as np
+from array import array
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache
+from typing import AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    # watchdog необязателен: без него слежение работает через опрос каталога
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+# Имя файла индекса тегов по умолчанию (создается в обрабатываемой директории)
+INDEX_FILENAME = '.id3v1_index.db'
 
 
 def detect_encoding(data: bytes) -> str:
@@ -48,6 +84,10 @@ def decode_string(byte_data: bytes) -> str:
     if not clean_data:
         return ""
 
+    # Чистый ASCII декодируется без статистического определения кодировки
+    if clean_data.isascii():
+        return clean_data.decode('ascii')
+
     # Пытаемся определить кодировку
     encoding = detect_encoding(clean_data)
 
@@ -66,6 +106,151 @@ def decode_string(byte_data: bytes) -> str:
     return clean_data.decode('latin1', errors='replace')
 
 
+@lru_cache(maxsize=4096)
+def detect_tag_encoding(sample: bytes) -> str:
+    """
+    Определяет кодировку по объединенным байтам всех полей тега.
+
+    Одна проверка на тег вместо отдельной на каждое поле; результат кэшируется,
+    поэтому треки одного альбома с одинаковыми полями не проверяются повторно.
+
+    Args:
+        sample: Объединенные байты полей, содержащих символы вне ASCII
+
+    Returns:
+        Строка с названием кодировки
+    """
+    return detect_encoding(sample)
+
+
+def decode_tag_fields(fields: List[bytes]) -> List[str]:
+    """
+    Декодирует все текстовые поля тега с одним определением кодировки.
+
+    Поля только из ASCII декодируются напрямую (chardet для них и так возвращает ascii),
+    остальные - кодировкой, определенной по их объединенным байтам.
+
+    Args:
+        fields: Сырые байты полей тега
+
+    Returns:
+        Список декодированных строк в том же порядке
+    """
+    clean_fields = [field.rstrip(b'\x00') for field in fields]
+    non_ascii = [field for field in clean_fields if not field.isascii()]
+
+    encoding = detect_tag_encoding(b' '.join(non_ascii)) if non_ascii else 'ascii'
+
+    decoded = []
+    for field in clean_fields:
+        if field.isascii():
+            decoded.append(field.decode('ascii'))
+            continue
+        try:
+            decoded.append(field.decode(encoding))
+        except UnicodeDecodeError:
+            # Общая кодировка не подошла этому полю - декодируем его отдельно
+            decoded.append(decode_string(field))
+    return decoded
+
+
+def detect_block_encoding(tag_data: bytes) -> str:
+    """
+    Возвращает кодировку, которой parse_id3v1_tag декодирует текст тега.
+
+    Повторный вызов после разбора тега не запускает определение заново:
+    результат берется из кэша detect_tag_encoding.
+
+    Args:
+        tag_data: 128-байтный блок ID3v1-тега
+
+    Returns:
+        Строка с названием кодировки ('ascii' для тегов без байтов > 127)
+    """
+    if tag_data[3:127].isascii():
+        return 'ascii'
+
+    comment_end = 125 if tag_data[125] == 0 else 127
+    fields = [tag_data[3:33], tag_data[33:63], tag_data[63:93], tag_data[93:97], tag_data[97:comment_end]]
+    clean_fields = [field.rstrip(b'\x00') for field in fields]
+    return detect_tag_encoding(b' '.join(field for field in clean_fields if not field.isascii()))
+
+
+def read_tail_block(f) -> bytes:
+    """
+    Читает последние 128 байт из уже открытого файла.
+
+    Args:
+        f: Файловый объект, открытый в двоичном режиме
+
+    Returns:
+        Сырые 128 байт или меньше, если файл короче
+    """
+    # Перемещаемся к концу файла минус 128 байт (размер ID3v1 тега)
+    size = f.seek(0, os.SEEK_END)
+    f.seek(max(size - 128, 0))
+    return f.read(128)
+
+
+def read_id3v1_block(file_path: str) -> bytes:
+    """
+    Читает последние 128 байт файла, где располагается ID3v1-тег.
+
+    Args:
+        file_path: Путь к MP3 файлу
+
+    Returns:
+        Сырые 128 байт (исключения ввода-вывода не перехватываются)
+    """
+    with open(file_path, 'rb') as f:
+        return read_tail_block(f)
+
+
+def parse_id3v1_tag(tag_data: bytes) -> Optional[Dict]:
+    """
+    Разбирает 128-байтный блок ID3v1-тега.
+
+    Args:
+        tag_data: Сырые данные тега
+
+    Returns:
+        Словарь с тегами или None, если блок не является ID3v1-тегом
+    """
+    # Проверяем, что это действительно ID3v1-тег (первые 3 байта должны быть "TAG")
+    if len(tag_data) < 128 or tag_data[:3] != b'TAG':
+        return None
+
+    # Проверяем, содержит ли комментарийный раздел информацию о треке
+    if tag_data[125] == 0:
+        comment_data = tag_data[97:125]
+        track = tag_data[126]
+    else:
+        comment_data = tag_data[97:127]
+        track = 0
+
+    fields = [tag_data[3:33], tag_data[33:63], tag_data[63:93], tag_data[93:97], comment_data]
+
+    # Одна проверка всего текстового блока: если в нем нет байтов > 127,
+    # все поля декодируются напрямую, без поиска кодировки
+    if tag_data[3:127].isascii():
+        title, artist, album, year, comment = [field.rstrip(b'\x00').decode('ascii') for field in fields]
+    else:
+        # Распаковываем данные с учетом кодировки (определяется один раз на тег)
+        title, artist, album, year, comment = decode_tag_fields(fields)
+
+    genre = tag_data[127]
+
+    return {
+        'title': title,
+        'artist': artist,
+        'album': album,
+        'year': year,
+        'comment': comment,
+        'track': track,
+        'genre': genre
+    }
+
+
 def get_id3v1_tag(file_path: str) -> Tuple[Optional[Dict], bytes]:
     """
     Извлекает ID3v1-тег из MP3 файла.
@@ -77,43 +262,281 @@ def get_id3v1_tag(file_path: str) -> Tuple[Optional[Dict], bytes]:
         Кортеж (словарь с тегами или None, если тег не найден, и сырые данные тега)
     """
     try:
-        with open(file_path, 'rb') as f:
-            # Перемещаемся к концу файла минус 128 байт (размер ID3v1 тега)
-            f.seek(-128, os.SEEK_END)
-            tag_data = f.read(128)
-
-            # Проверяем, что это действительно ID3v1-тег (первые 3 байта должны быть "TAG")
-            if tag_data[:3] != b'TAG':
-                return None, b''
-
-            # Распаковываем данные с учетом кодировки
-            title = decode_string(tag_data[3:33])
-            artist = decode_string(tag_data[33:63])
-            album = decode_string(tag_data[63:93])
-            year = decode_string(tag_data[93:97])
-
-            # Проверяем, содержит ли комментарийный раздел информацию о треке
-            if tag_data[125] == 0:
-                comment = decode_string(tag_data[97:125])
-                track = tag_data[126]
-            else:
-                comment = decode_string(tag_data[97:127])
-                track = 0
+        tag_data = read_id3v1_block(file_path)
+        tag_info = parse_id3v1_tag(tag_data)
+        if tag_info is None:
+            return None, b''
+        return tag_info, tag_data
+    except Exception as e:
+        print(f"Ошибка при чтении файла {file_path}: {e}", file=sys.stderr)
+        return None, b''
 
-            genre = tag_data[127]
 
-            return {
-                'title': title,
-                'artist': artist,
-                'album': album,
-                'year': year,
-                'comment': comment,
-                'track': track,
-                'genre': genre
-            }, tag_data
+# Кадры ID3v2, которые соответствуют полям ID3v1 (v2.3/v2.4 и v2.2)
+ID3V2_FRAMES = {
+    b'TIT2': 'title', b'TPE1': 'artist', b'TALB': 'album', b'TYER': 'year', b'TDRC': 'year',
+    b'COMM': 'comment', b'TRCK': 'track', b'TCON': 'genre',
+    b'TT2': 'title', b'TP1': 'artist', b'TAL': 'album', b'TYE': 'year',
+    b'COM': 'comment', b'TRK': 'track', b'TCO': 'genre',
+}
+
+# Ограничение на размер читаемого тела кадра (текстовым кадрам этого с запасом хватает)
+ID3V2_MAX_FRAME_READ = 4096
+
+
+def syncsafe_to_int(data: bytes) -> int:
+    """Преобразует syncsafe-целое ID3v2 (по 7 бит в байте) в число"""
+    value = 0
+    for b in data:
+        value = (value << 7) | (b & 0x7F)
+    return value
+
+
+def decode_id3v2_text(data: bytes, text_encoding: int) -> str:
+    """
+    Декодирует текст кадра ID3v2 по байту кодировки.
+
+    Args:
+        data: Байты текста (без байта кодировки)
+        text_encoding: 0 - ISO-8859-1, 1 - UTF-16 с BOM, 2 - UTF-16BE, 3 - UTF-8
+
+    Returns:
+        Первое значение кадра без завершающих нулей
+    """
+    if text_encoding in (1, 2):
+        codec = 'utf-16' if text_encoding == 1 else 'utf-16-be'
+        # Значения разделяются двумя нулевыми байтами на четной позиции
+        end = 0
+        while end + 1 < len(data) and data[end:end + 2] != b'\x00\x00':
+            end += 2
+        return data[:end].decode(codec, errors='replace')
+
+    value = data.split(b'\x00', 1)[0]
+    if text_encoding == 3:
+        return value.decode('utf-8', errors='replace')
+    # Кодировка 0 формально ISO-8859-1, но на практике там часто windows-1251
+    return decode_string(value)
+
+
+def split_id3v2_comment(data: bytes, text_encoding: int) -> bytes:
+    """Отделяет текст кадра COMM от языка и краткого описания"""
+    body = data[3:]
+    if text_encoding in (1, 2):
+        for i in range(0, len(body) - 1, 2):
+            if body[i:i + 2] == b'\x00\x00':
+                return body[i + 2:]
+        return b''
+    _, _, text = body.partition(b'\x00')
+    return text
+
+
+def read_id3v2_tag(f) -> Optional[Dict]:
+    """
+    Читает ID3v2-тег из начала уже открытого файла.
+
+    Читаются только заголовки кадров и тела нужных кадров (ограниченного размера),
+    остальные кадры (обложки и т.п.) пропускаются через seek, аудиоданные не читаются.
+
+    Args:
+        f: Файловый объект, открытый в двоичном режиме
+
+    Returns:
+        Словарь с найденными полями (подмножество ключей get_id3v1_tag) или None
+    """
+    f.seek(0)
+    header = f.read(10)
+    if len(header) < 10 or header[:3] != b'ID3':
+        return None
+
+    version = header[3]
+    flags = header[5]
+    tag_end = 10 + syncsafe_to_int(header[6:10])
+    if version not in (2, 3, 4):
+        return None
+
+    # Пропускаем расширенный заголовок
+    if flags & 0x40 and version in (3, 4):
+        ext_size = f.read(4)
+        if len(ext_size) < 4:
+            return None
+        if version == 4:
+            f.seek(syncsafe_to_int(ext_size) - 4, os.SEEK_CUR)
+        else:
+            f.seek(int.from_bytes(ext_size, 'big'), os.SEEK_CUR)
+
+    id_length, header_length = (3, 6) if version == 2 else (4, 10)
+    result = {}
+
+    while f.tell() + header_length <= tag_end and len(result) < 7:
+        frame_header = f.read(header_length)
+        frame_id = frame_header[:id_length]
+
+        # Нулевые байты означают начало выравнивания - кадров больше нет
+        if len(frame_header) < header_length or frame_id[:1] == b'\x00':
+            break
+
+        if version == 2:
+            frame_size = int.from_bytes(frame_header[3:6], 'big')
+        elif version == 4:
+            frame_size = syncsafe_to_int(frame_header[4:8])
+        else:
+            frame_size = int.from_bytes(frame_header[4:8], 'big')
+
+        field = ID3V2_FRAMES.get(frame_id)
+        if field is None or field in result or frame_size < 2:
+            f.seek(frame_size, os.SEEK_CUR)
+            continue
+
+        read_size = min(frame_size, ID3V2_MAX_FRAME_READ)
+        body = f.read(read_size)
+        if read_size < frame_size:
+            f.seek(frame_size - read_size, os.SEEK_CUR)
+
+        text_encoding, data = body[0], body[1:]
+        if field == 'comment':
+            data = split_id3v2_comment(data, text_encoding)
+        text = decode_id3v2_text(data, text_encoding).strip()
+
+        if field == 'track':
+            # "3/12" -> 3
+            number = text.split('/')[0]
+            if number.isdigit():
+                result['track'] = min(int(number), 255)
+        elif field == 'genre':
+            # "(17)", "17" или "(17)Rock" -> 17; названия ищутся в таблице жанров
+            number = text[1:text.find(')')] if text.startswith('(') else text
+            if number.isdigit() and int(number) <= 255:
+                result['genre'] = int(number)
+            elif text.casefold() in ID3V1_GENRE_IDS:
+                result['genre'] = ID3V1_GENRE_IDS[text.casefold()]
+        elif field == 'year':
+            result['year'] = text[:4]
+        elif text:
+            result[field] = text
+
+    return result or None
+
+
+def get_id3v2_tag(file_path: str) -> Optional[Dict]:
+    """
+    Извлекает ID3v2-тег из MP3 файла.
+
+    Args:
+        file_path: Путь к MP3 файлу
+
+    Returns:
+        Словарь с найденными полями или None, если тега нет
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            return read_id3v2_tag(f)
     except Exception as e:
-        print(f"Ошибка при чтении файла {file_path}: {e}")
-        return None, b''
+        print(f"Ошибка при чтении ID3v2 из файла {file_path}: {e}", file=sys.stderr)
+        return None
+
+
+def merge_id3_tags(v1_info: Optional[Dict], v2_info: Optional[Dict]) -> Optional[Dict]:
+    """
+    Объединяет ID3v1 и ID3v2: непустые значения ID3v2 имеют приоритет.
+
+    Args:
+        v1_info: Результат get_id3v1_tag (или None)
+        v2_info: Результат get_id3v2_tag (или None)
+
+    Returns:
+        Словарь в формате get_id3v1_tag или None, если нет ни одного тега
+    """
+    if v1_info is None and v2_info is None:
+        return None
+
+    merged = {'title': '', 'artist': '', 'album': '', 'year': '', 'comment': '', 'track': 0, 'genre': 255}
+    merged.update(v1_info or {})
+    merged.update(v2_info or {})
+    return merged
+
+
+class TagIndex:
+    """
+    Постоянный индекс ID3v1-тегов в SQLite.
+
+    Запись индекса привязана к пути, размеру, времени изменения и inode файла:
+    если хотя бы одно из них изменилось, файл читается заново.
+    """
+
+    def __init__(self, db_path: str):
+        # Индекс используется из рабочих потоков, поэтому доступ к соединению под блокировкой
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.pending = 0
+
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS tags (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            inode INTEGER NOT NULL,
+            tag_info TEXT,
+            tag_data BLOB NOT NULL
+        )
+        ''')
+        self.conn.commit()
+
+    def lookup(self, file_path: str, file_stat: os.stat_result) -> Optional[Tuple[Optional[Dict], bytes]]:
+        """
+        Возвращает сохраненный результат get_id3v1_tag, если файл не изменился.
+
+        Args:
+            file_path: Путь к MP3 файлу
+            file_stat: Результат stat для файла
+
+        Returns:
+            Кортеж как у get_id3v1_tag или None при промахе
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT tag_info, tag_data FROM tags WHERE path = ? AND size = ? AND mtime_ns = ? AND inode = ?",
+                (file_path, file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino)
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+
+        tag_info = json.loads(row[0]) if row[0] is not None else None
+        return tag_info, bytes(row[1])
+
+    def store(self, file_path: str, file_stat: os.stat_result, tag_info: Optional[Dict], tag_data: bytes):
+        """Сохраняет результат чтения тега для файла"""
+        encoded_info = json.dumps(tag_info, ensure_ascii=False) if tag_info is not None else None
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO tags (path, size, mtime_ns, inode, tag_info, tag_data) VALUES (?, ?, ?, ?, ?, ?)",
+                (file_path, file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino, encoded_info, tag_data)
+            )
+            self._commit_periodically()
+
+    def forget(self, file_path: str):
+        """Удаляет запись о файле (например, после перезаписи тега)"""
+        with self.lock:
+            self.conn.execute("DELETE FROM tags WHERE path = ?", (file_path,))
+            self._commit_periodically()
+
+    def _commit_periodically(self):
+        # Фиксируем изменения пачками, а не после каждого файла
+        self.pending += 1
+        if self.pending >= 1000:
+            self.conn.commit()
+            self.pending = 0
+
+    def close(self):
+        """Фиксирует изменения и закрывает индекс"""
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
 
 
 def encode_string(text: str, max_length: int, encoding: str = 'windows-1251') -> bytes:
@@ -146,6 +569,70 @@ def encode_string(text: str, max_length: int, encoding: str = 'windows-1251') ->
     return encoded[:max_length]
 
 
+def build_id3v1_tag(tag_data: Dict, encoding: str = 'windows-1251') -> bytes:
+    """
+    Формирует 128-байтный блок ID3v1-тега.
+
+    Args:
+        tag_data: Словарь с тегами для записи
+        encoding: Кодировка для записи текста (по умолчанию windows-1251)
+
+    Returns:
+        Байты нового тега
+    """
+    new_tag = bytearray(128)
+
+    # Заголовок "TAG"
+    new_tag[0:3] = b'TAG'
+
+    # Записываем поля с указанной кодировкой
+    title_bytes = encode_string(tag_data['title'], 30, encoding)
+    new_tag[3:3 + len(title_bytes)] = title_bytes
+
+    artist_bytes = encode_string(tag_data['artist'], 30, encoding)
+    new_tag[33:33 + len(artist_bytes)] = artist_bytes
+
+    album_bytes = encode_string(tag_data['album'], 30, encoding)
+    new_tag[63:63 + len(album_bytes)] = album_bytes
+
+    year_bytes = encode_string(tag_data['year'], 4, encoding)
+    new_tag[93:93 + len(year_bytes)] = year_bytes
+
+    comment_bytes = encode_string(tag_data['comment'], 28, encoding)
+    new_tag[97:97 + len(comment_bytes)] = comment_bytes
+
+    # Zero-byte для трека
+    new_tag[125] = 0
+
+    # Номер трека
+    new_tag[126] = tag_data['track']
+
+    # Жанр
+    new_tag[127] = tag_data['genre']
+
+    return bytes(new_tag)
+
+
+def write_tag_block(f, new_tag: bytes, has_tag: bool):
+    """
+    Записывает готовый блок тега в уже открытый файл.
+
+    Args:
+        f: Файловый объект, открытый в режиме 'r+b'
+        new_tag: 128 байт нового тега
+        has_tag: Есть ли в файле ID3v1-тег, который нужно заменить
+    """
+    if has_tag:
+        # Если тег уже есть, перемещаемся к его началу
+        f.seek(-128, os.SEEK_END)
+    else:
+        # Если тега нет, перемещаемся в конец файла
+        f.seek(0, os.SEEK_END)
+
+    f.write(new_tag)
+    f.flush()
+
+
 def write_id3v1_tag(file_path: str, tag_data: Dict, encoding: str = 'windows-1251') -> bool:
     """
     Записывает ID3v1-тег в MP3 файл.
@@ -159,58 +646,71 @@ def write_id3v1_tag(file_path: str, tag_data: Dict, encoding: str = 'windows-125
         True если запись прошла успешно, иначе False
     """
     try:
-        # Определяем, есть ли уже ID3v1-тег
-        has_tag = False
-        with open(file_path, 'rb') as f:
-            f.seek(-128, os.SEEK_END)
-            has_tag = f.read(3) == b'TAG'
-
+        # Проверка наличия тега и запись выполняются через один и тот же дескриптор
         with open(file_path, 'r+b') as f:
-            if has_tag:
-                # Если тег уже есть, перемещаемся к его началу
-                f.seek(-128, os.SEEK_END)
-            else:
-                # Если тега нет, перемещаемся в конец файла
-                f.seek(0, os.SEEK_END)
+            has_tag = read_tail_block(f)[:3] == b'TAG'
+            write_tag_block(f, build_id3v1_tag(tag_data, encoding), has_tag)
 
-            # Формируем новый тег
-            new_tag = bytearray(128)
+        return True
+    except Exception as e:
+        print(f"Ошибка при записи тега в файл {file_path}: {e}", file=sys.stderr)
+        return False
 
-            # Заголовок "TAG"
-            new_tag[0:3] = b'TAG'
 
-            # Записываем поля с указанной кодировкой
-            title_bytes = encode_string(tag_data['title'], 30, encoding)
-            new_tag[3:3 + len(title_bytes)] = title_bytes
+def open_tag_file(file_path: str, writable: bool):
+    """
+    Открывает файл для чтения тега и, если возможно, для последующей записи.
 
-            artist_bytes = encode_string(tag_data['artist'], 30, encoding)
-            new_tag[33:33 + len(artist_bytes)] = artist_bytes
+    Args:
+        file_path: Путь к MP3 файлу
+        writable: Нужна ли возможность записи
 
-            album_bytes = encode_string(tag_data['album'], 30, encoding)
-            new_tag[63:63 + len(album_bytes)] = album_bytes
+    Returns:
+        Файловый объект ('r+b', либо 'rb', если файл нельзя открыть на запись)
+    """
+    if writable:
+        try:
+            return open(file_path, 'r+b')
+        except OSError:
+            # Нет прав на запись, файловая система только для чтения (EROFS) и т.п. -
+            # тег все равно должен быть прочитан; если файла нет, 'rb' сообщит об этом сам
+            pass
+    return open(file_path, 'rb')
 
-            year_bytes = encode_string(tag_data['year'], 4, encoding)
-            new_tag[93:93 + len(year_bytes)] = year_bytes
 
-            comment_bytes = encode_string(tag_data['comment'], 28, encoding)
-            new_tag[97:97 + len(comment_bytes)] = comment_bytes
+# Таблица для символьной части дампа: непечатаемые байты заменяются точкой
+HEX_DUMP_ASCII_TABLE = bytes(b if 32 <= b < 127 else ord('.') for b in range(256))
 
-            # Zero-byte для трека
-            new_tag[125] = 0
+# Количество строк дампа, обрабатываемых за одну векторную операцию
+HEX_DUMP_BLOCK_LINES = 4096
 
-            # Номер трека
-            new_tag[126] = tag_data['track']
 
-            # Жанр
-            new_tag[127] = tag_data['genre']
+def iter_hex_dump(data: bytes) -> Iterator[str]:
+    """
+    Лениво формирует строки 16-ричного дампа.
 
-            # Записываем тег
-            f.write(new_tag)
+    Данные обрабатываются блоками: шестнадцатеричное и символьное представление
+    строятся для всего блока встроенными bytes.hex и bytes.translate,
+    а строки лишь нарезаются из готовых результатов.
 
-        return True
-    except Exception as e:
-        print(f"Ошибка при записи тега в файл {file_path}: {e}")
-        return False
+    Args:
+        data: Байты для дампа (подходят bytes, bytearray и memoryview)
+
+    Returns:
+        Итератор строк дампа в формате hex_dump
+    """
+    view = memoryview(data)
+    block_size = HEX_DUMP_BLOCK_LINES * 16
+
+    for block_start in range(0, len(view), block_size):
+        block = bytes(view[block_start:block_start + block_size])
+        hex_block = block.hex(' ').upper()
+        ascii_block = block.translate(HEX_DUMP_ASCII_TABLE).decode('ascii')
+
+        for line_start in range(0, len(block), 16):
+            hex_values = hex_block[line_start * 3:line_start * 3 + 47]
+            ascii_repr = ascii_block[line_start:line_start + 16]
+            yield f"{block_start + line_start:04X}: {hex_values:<48} | {ascii_repr}"
 
 
 def hex_dump(data: bytes) -> str:
@@ -223,34 +723,1850 @@ def hex_dump(data: bytes) -> str:
     Returns:
         Строка с 16-ричным дампом
     """
-    hex_lines = []
-    for i in range(0, len(data), 16):
-        chunk = data[i:i + 16]
-        hex_values = ' '.join(f'{b:02X}' for b in chunk)
+    return '\n'.join(iter_hex_dump(data))
+
+
+class TagStore:
+    """
+    Компактное колоночное хранилище ID3v1-тегов для анализа больших библиотек.
+
+    Текстовые поля интернируются в общий пул строк, а в колонках (array.array)
+    хранятся только их номера; номер трека и жанр занимают по одному байту.
+    Для фильтрации колонки без копирования отображаются в массивы NumPy.
+    """
 
-        # Добавляем символьное представление
-        ascii_repr = ''.join(chr(b) if 32 <= b < 127 else '.' for b in chunk)
+    TEXT_FIELDS = ('title', 'artist', 'album', 'year', 'comment')
+    BYTE_FIELDS = ('track', 'genre')
+
+    def __init__(self):
+        self.strings: List[str] = []
+        self.string_ids: Dict[str, int] = {}
+        self.names: List[str] = []
+        self.columns = {field: array('I') for field in self.TEXT_FIELDS + ('directory',)}
+        self.columns.update({field: array('B') for field in self.BYTE_FIELDS})
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def intern(self, text: str) -> int:
+        """Возвращает номер строки в пуле, добавляя ее при первом появлении"""
+        string_id = self.string_ids.get(text)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.strings.append(text)
+            self.string_ids[text] = string_id
+        return string_id
+
+    def add(self, file_path: str, tag_info: Dict):
+        """Добавляет тег файла в хранилище"""
+        directory, name = os.path.split(file_path)
+        self.names.append(name)
+        self.columns['directory'].append(self.intern(directory))
+        for field in self.TEXT_FIELDS:
+            self.columns[field].append(self.intern(tag_info[field]))
+        for field in self.BYTE_FIELDS:
+            self.columns[field].append(tag_info[field])
+
+    def column(self, field: str) -> np.ndarray:
+        """
+        Возвращает колонку как массив NumPy (без копирования данных).
+
+        Для текстовых полей это номера строк в пуле.
+        """
+        values = self.columns[field]
+        return np.frombuffer(values, dtype=np.uint32 if values.typecode == 'I' else np.uint8)
+
+    def filter(self, **conditions) -> np.ndarray:
+        """
+        Векторный отбор записей по равенству полей.
+
+        Пример: store.filter(genre=255, track=0)
+
+        Args:
+            conditions: Поле и требуемое значение (строка для текстовых полей, число для track/genre)
+
+        Returns:
+            Массив номеров подходящих записей
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for field, value in conditions.items():
+            if field in self.BYTE_FIELDS:
+                mask &= self.column(field) == int(value)
+            else:
+                # Строки, которой нет в пуле, нет ни в одной записи
+                string_id = self.string_ids.get(value)
+                if string_id is None:
+                    return np.empty(0, dtype=np.intp)
+                mask &= self.column(field) == string_id
+        return np.flatnonzero(mask)
+
+    def path(self, row: int) -> str:
+        """Возвращает путь к файлу записи"""
+        return os.path.join(self.strings[self.columns['directory'][row]], self.names[row])
+
+    def row(self, row: int) -> Dict:
+        """Восстанавливает словарь тега записи (в формате get_id3v1_tag)"""
+        tag_info = {field: self.strings[self.columns[field][row]] for field in self.TEXT_FIELDS}
+        tag_info.update({field: self.columns[field][row] for field in self.BYTE_FIELDS})
+        return tag_info
+
+    @classmethod
+    def load(cls, directory: str, recursive: bool = False, jobs: int = 1) -> 'TagStore':
+        """
+        Загружает ID3v1-теги всех mp3-файлов директории.
+
+        Args:
+            directory: Директория с MP3 файлами
+            recursive: Обходить ли вложенные директории
+            jobs: Количество потоков для чтения
+
+        Returns:
+            Заполненное хранилище (файлы без тега пропускаются)
+        """
+        store = cls()
+
+        def read(entry: os.DirEntry) -> Tuple[str, Optional[Dict]]:
+            return entry.path, get_id3v1_tag(entry.path)[0]
+
+        for file_path, tag_info in run_ordered(read, iter_mp3_files(directory, recursive), jobs):
+            if tag_info is not None:
+                store.add(file_path, tag_info)
+        return store
+
+
+def normalize_tag_text(text: str) -> str:
+    """
+    Нормализует текст тега для сравнения: регистр, ё/е, пунктуация и пробелы.
 
-        # Форматируем строку
-        line = f"{i:04X}: {hex_values:<48} | {ascii_repr}"
-        hex_lines.append(line)
+    Args:
+        text: Исходный текст
 
-    return '\n'.join(hex_lines)
+    Returns:
+        Нормализованная строка
+    """
+    text = text.casefold().replace('ё', 'е')
+    text = ''.join(ch if ch.isalnum() else ' ' for ch in text)
+    return ' '.join(text.split())
 
 
-def main():
+def find_duplicates(directory: str, recursive: bool = False, jobs: int = 1,
+                    fuzzy: Optional[float] = None) -> Dict:
+    """
+    Ищет дубликаты треков по нормализованным исполнителю, названию и альбому и размеру файла.
+
+    Точные дубликаты находятся через хэш-индекс за один проход. При нечетком поиске
+    записи дополнительно разбиваются на блоки по началу исполнителя и названия,
+    и попарно сравниваются только внутри блока, так что квадратичного сравнения всей
+    библиотеки нет.
+
+    Args:
+        directory: Директория с MP3 файлами
+        recursive: Обходить ли вложенные директории
+        jobs: Количество потоков для чтения
+        fuzzy: Порог похожести (0-1) для нечеткого поиска или None
+
+    Returns:
+        Отчет в виде словаря, пригодного для сериализации в JSON
+    """
+    def read(entry: os.DirEntry) -> Tuple[str, int, Optional[Dict]]:
+        return entry.path, entry.stat().st_size, get_id3v1_tag(entry.path)[0]
+
+    exact_index: Dict[Tuple, List[int]] = {}
+    blocks: Dict[Tuple[str, str], List[int]] = {}
+    files: List[Tuple[str, int]] = []
+    keys: List[Tuple] = []
+    scanned = 0
+
+    for file_path, size, tag_info in run_ordered(read, iter_mp3_files(directory, recursive), jobs):
+        scanned += 1
+        if tag_info is None:
+            continue
+
+        key = (normalize_tag_text(tag_info['artist']), normalize_tag_text(tag_info['title']),
+               normalize_tag_text(tag_info['album']))
+        if not any(key):
+            continue
+
+        file_id = len(files)
+        files.append((file_path, size))
+        keys.append(key)
+        exact_index.setdefault(key + (size,), []).append(file_id)
+        if fuzzy is not None:
+            blocks.setdefault((key[0][:4], key[1][:4]), []).append(file_id)
+
+    # Объединяем найденные совпадения в группы (система непересекающихся множеств)
+    parent = list(range(len(files)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for ids in exact_index.values():
+        for other in ids[1:]:
+            parent[find(other)] = find(ids[0])
+
+    if fuzzy is not None:
+        for ids in blocks.values():
+            for i, first in enumerate(ids):
+                for second in ids[i + 1:]:
+                    if find(first) == find(second):
+                        continue
+                    ratio = difflib.SequenceMatcher(None, ' | '.join(keys[first]), ' | '.join(keys[second])).ratio()
+                    if ratio >= fuzzy:
+                        parent[find(second)] = find(first)
+
+    groups: Dict[int, List[int]] = {}
+    for file_id in range(len(files)):
+        groups.setdefault(find(file_id), []).append(file_id)
+
+    report_groups = []
+    for ids in groups.values():
+        if len(ids) < 2:
+            continue
+        exact = len({keys[i] + (files[i][1],) for i in ids}) == 1
+        artist, title, album = keys[ids[0]]
+        report_groups.append({
+            'match': 'exact' if exact else 'fuzzy',
+            'artist': artist,
+            'title': title,
+            'album': album,
+            'files': [{'path': files[i][0], 'size': files[i][1]} for i in ids]
+        })
+
+    return {
+        'files_scanned': scanned,
+        'files_with_tags': len(files),
+        'duplicate_groups': len(report_groups),
+        'groups': report_groups
+    }
+
+
+def iter_mp3_files(directory: str, recursive: bool = False) -> Iterator[os.DirEntry]:
+    """
+    Лениво перечисляет mp3-файлы директории через os.scandir.
+
+    Записи отдаются сразу по мере чтения каталога, полный список не строится.
+    Тип записи берется из данных самого каталога (DirEntry кэширует stat),
+    поэтому повторных обращений к файловой системе за каждым файлом нет.
+
+    Args:
+        directory: Директория для обхода
+        recursive: Обходить ли вложенные директории
+
+    Returns:
+        Итератор записей DirEntry для mp3-файлов
+    """
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive:
+                            yield from iter_mp3_files(entry.path, recursive)
+                    elif entry.name.lower().endswith('.mp3') and entry.is_file():
+                        yield entry
+                except OSError as e:
+                    print(f"Ошибка при обходе {entry.path}: {e}", file=sys.stderr)
+    except OSError as e:
+        print(f"Ошибка при чтении директории {directory}: {e}", file=sys.stderr)
+
+
+# Таблица жанров ID3v1: номер жанра - индекс в кортеже (0-79 стандарт, 80-191 расширения Winamp)
+ID3V1_GENRES = (
+    'Blues', 'Classic Rock', 'Country', 'Dance', 'Disco', 'Funk', 'Grunge', 'Hip-Hop', 'Jazz', 'Metal',
+    'New Age', 'Oldies', 'Other', 'Pop', 'R&B', 'Rap', 'Reggae', 'Rock', 'Techno', 'Industrial', 'Alternative',
+    'Ska', 'Death Metal', 'Pranks', 'Soundtrack', 'Euro-Techno', 'Ambient', 'Trip-Hop', 'Vocal', 'Jazz+Funk',
+    'Fusion', 'Trance', 'Classical', 'Instrumental', 'Acid', 'House', 'Game', 'Sound Clip', 'Gospel', 'Noise',
+    'AlternRock', 'Bass', 'Soul', 'Punk', 'Space', 'Meditative', 'Instrumental Pop', 'Instrumental Rock',
+    'Ethnic', 'Gothic', 'Darkwave', 'Techno-Industrial', 'Electronic', 'Pop-Folk', 'Eurodance', 'Dream',
+    'Southern Rock', 'Comedy', 'Cult', 'Gangsta', 'Top 40', 'Christian Rap', 'Pop/Funk', 'Jungle',
+    'Native American', 'Cabaret', 'New Wave', 'Psychadelic', 'Rave', 'Showtunes', 'Trailer', 'Lo-Fi', 'Tribal',
+    'Acid Punk', 'Acid Jazz', 'Polka', 'Retro', 'Musical', 'Rock & Roll', 'Hard Rock', 'Folk', 'Folk-Rock',
+    'National Folk', 'Swing', 'Fast Fusion', 'Bebob', 'Latin', 'Revival', 'Celtic', 'Bluegrass', 'Avantgarde',
+    'Gothic Rock', 'Progressive Rock', 'Psychedelic Rock', 'Symphonic Rock', 'Slow Rock', 'Big Band', 'Chorus',
+    'Easy Listening', 'Acoustic', 'Humour', 'Speech', 'Chanson', 'Opera', 'Chamber Music', 'Sonata',
+    'Symphony', 'Booty Bass', 'Primus', 'Porn Groove', 'Satire', 'Slow Jam', 'Club', 'Tango', 'Samba',
+    'Folklore', 'Ballad', 'Power Ballad', 'Rhythmic Soul', 'Freestyle', 'Duet', 'Punk Rock', 'Drum Solo',
+    'A capella', 'Euro-House', 'Dance Hall', 'Goa', 'Drum & Bass', 'Club-House', 'Hardcore', 'Terror', 'Indie',
+    'BritPop', 'Negerpunk', 'Polsk Punk', 'Beat', 'Christian Gangsta Rap', 'Heavy Metal', 'Black Metal',
+    'Crossover', 'Contemporary Christian', 'Christian Rock', 'Merengue', 'Salsa', 'Thrash Metal', 'Anime',
+    'JPop', 'Synthpop', 'Abstract', 'Art Rock', 'Baroque', 'Bhangra', 'Big Beat', 'Breakbeat', 'Chillout',
+    'Downtempo', 'Dub', 'EBM', 'Eclectic', 'Electro', 'Electroclash', 'Emo', 'Experimental', 'Garage',
+    'Global', 'IDM', 'Illbient', 'Industro-Goth', 'Jam Band', 'Krautrock', 'Leftfield', 'Lounge', 'Math Rock',
+    'New Romantic', 'Nu-Breakz', 'Post-Punk', 'Post-Rock', 'Psytrance', 'Shoegaze', 'Space Rock', 'Trop Rock',
+    'World Music', 'Neoclassical', 'Audiobook', 'Audio Theatre', 'Neue Deutsche Welle', 'Podcast',
+    'Indie Rock', 'G-Funk', 'Dubstep', 'Garage Rock', 'Psybient'
+)
+
+# Обратная таблица: название жанра (без учета регистра) -> номер
+ID3V1_GENRE_IDS = {name.casefold(): genre_id for genre_id, name in enumerate(ID3V1_GENRES)}
+
+
+def genre_name(genre_id: int) -> str:
+    """Возвращает название жанра ID3v1 по номеру ('' для 255 и неизвестных номеров)"""
+    return ID3V1_GENRES[genre_id] if 0 <= genre_id < len(ID3V1_GENRES) else ''
+
+
+def parse_genre(value) -> int:
+    """
+    Преобразует номер или название жанра в номер жанра ID3v1.
+
+    Args:
+        value: Число, строка с числом или название жанра (без учета регистра)
+
+    Returns:
+        Номер жанра (0-255)
+    """
+    if isinstance(value, int) and not isinstance(value, bool):
+        genre_id = value
+    elif str(value).strip().lstrip('-').isdigit():
+        genre_id = int(str(value).strip())
+    else:
+        genre_id = None
+
+    if genre_id is not None:
+        # Жанр занимает один байт тега
+        if not 0 <= genre_id <= 255:
+            raise argparse.ArgumentTypeError(f"номер жанра должен быть в диапазоне 0-255: {genre_id}")
+        return genre_id
+
+    text = str(value).strip()
+    genre_id = ID3V1_GENRE_IDS.get(text.casefold())
+    if genre_id is None:
+        raise argparse.ArgumentTypeError(f"неизвестный жанр: {text}")
+    return genre_id
+
+
+class GenreRules:
+    """
+    Правила простановки жанра по исполнителю и директории.
+
+    Правила загружаются из JSON вида
+    {"artists": {"Кино": "Rock"}, "directories": {"Jazz/*": "Jazz", "Classic": 32}}
+    и компилируются один раз: исполнители - в словарь, а шаблоны директорий
+    (fnmatch, относительно корня обработки) - в одно регулярное выражение.
+    Результат проверки директории кэшируется, поэтому на файл приходится
+    одна-две операции со словарем.
+    """
+
+    def __init__(self, artists: Dict[str, int], directories: List[Tuple[str, int]], root: str = '.'):
+        self.root = root
+        self.artists = {normalize_tag_text(artist): genre_id for artist, genre_id in artists.items()}
+        self.directory_genres = [genre_id for _, genre_id in directories]
+        self.directory_patterns = [pattern for pattern, _ in directories]
+        self.directory_regex = None
+        if directories:
+            self.directory_regex = re.compile('|'.join(
+                f'(?P<rule{number}>{fnmatch.translate(pattern.strip("/"))})'
+                for number, (pattern, _) in enumerate(directories)
+            ))
+        self.match_directory = lru_cache(maxsize=4096)(self._match_directory)
+
+    @classmethod
+    def load(cls, rules_path: str, root: str = '.') -> 'GenreRules':
+        """Загружает правила из JSON файла (жанры задаются номером или названием)"""
+        with open(rules_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        def rule_genre(kind: str, key: str, genre) -> int:
+            try:
+                return parse_genre(genre)
+            except argparse.ArgumentTypeError as e:
+                raise ValueError(f"правило {kind} {key}: {e}") from None
+
+        artists = {artist: rule_genre('исполнителя', artist, genre)
+                   for artist, genre in data.get('artists', {}).items()}
+        directories = [(pattern, rule_genre('директории', pattern, genre))
+                       for pattern, genre in data.get('directories', {}).items()]
+        return cls(artists, directories, root)
+
+    def _match_directory(self, directory: str) -> Optional[Tuple[int, str]]:
+        if self.directory_regex is None:
+            return None
+        relative = os.path.relpath(directory, self.root).replace(os.sep, '/')
+        match = self.directory_regex.match(relative)
+        if match is None:
+            return None
+        number = int(match.lastgroup[4:])
+        return self.directory_genres[number], f"директория {self.directory_patterns[number]}"
+
+    def match(self, file_path: str, artist: str) -> Optional[Tuple[int, str]]:
+        """
+        Находит жанр для файла: правило исполнителя важнее правила директории.
+
+        Args:
+            file_path: Путь к MP3 файлу
+            artist: Исполнитель из тега
+
+        Returns:
+            Кортеж (номер жанра, сработавшее правило) или None
+        """
+        genre_id = self.artists.get(normalize_tag_text(artist))
+        if genre_id is not None:
+            return genre_id, f"исполнитель {artist}"
+        return self.match_directory(os.path.dirname(file_path))
+
+
+# Этапы конвейера в порядке вывода в отчете профилировщика
+PROFILE_STAGES = ('listing', 'index', 'read', 'decode', 'encode', 'write')
+
+
+class NullProfiler:
+    """Заглушка профилировщика: ничего не измеряет и не добавляет накладных расходов"""
+
+    _context = nullcontext()
+
+    def stage(self, name: str):
+        return self._context
+
+    def iterate(self, name: str, items: Iterable) -> Iterable:
+        return items
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class StageProfiler:
+    """
+    Сбор длительностей этапов обработки файлов.
+
+    Для каждого этапа хранятся все замеры (array('d')), по ним строятся
+    перцентили и логарифмическая гистограмма.
+    """
+
+    def __init__(self):
+        self.samples: Dict[str, array] = {}
+        self.lock = threading.Lock()
+
+    def record(self, name: str, duration: float):
+        """Добавляет замер этапа"""
+        with self.lock:
+            self.samples.setdefault(name, array('d')).append(duration)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Контекстный менеджер, измеряющий время этапа"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def iterate(self, name: str, items: Iterable) -> Iterator:
+        """Оборачивает итератор, измеряя время получения каждого элемента"""
+        iterator = iter(items)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.record(name, time.perf_counter() - start)
+            yield item
+
+    @staticmethod
+    def percentile(sorted_values: List[float], fraction: float) -> float:
+        """Перцентиль по отсортированным значениям (ближайший ранг)"""
+        if not sorted_values:
+            return 0.0
+        position = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+        return sorted_values[position]
+
+    def report(self) -> str:
+        """
+        Формирует сводную таблицу по этапам и гистограммы длительностей.
+
+        Returns:
+            Текст отчета (время в миллисекундах)
+        """
+        names = [name for name in PROFILE_STAGES if name in self.samples]
+        names += sorted(name for name in self.samples if name not in PROFILE_STAGES)
+
+        lines = [f"{'Этап':<10}{'Кол-во':>10}{'Всего, с':>12}{'p50, мс':>10}{'p90, мс':>10}"
+                 f"{'p99, мс':>10}{'max, мс':>10}"]
+        histograms = []
+        for name in names:
+            values = sorted(self.samples[name])
+            lines.append(f"{name:<10}{len(values):>10}{sum(values):>12.3f}"
+                         f"{self.percentile(values, 0.5) * 1000:>10.3f}{self.percentile(values, 0.9) * 1000:>10.3f}"
+                         f"{self.percentile(values, 0.99) * 1000:>10.3f}{values[-1] * 1000:>10.3f}")
+
+            # Гистограмма с корзинами по степеням двойки микросекунд
+            buckets: Dict[int, int] = {}
+            for value in values:
+                bucket = max(int(value * 1_000_000), 1).bit_length() - 1
+                buckets[bucket] = buckets.get(bucket, 0) + 1
+            peak = max(buckets.values())
+            histograms.append(f"Гистограмма '{name}':")
+            for bucket in sorted(buckets):
+                bar = '#' * max(1, buckets[bucket] * 40 // peak)
+                histograms.append(f"  {2 ** bucket:>9} мкс - {2 ** (bucket + 1):>9} мкс | {buckets[bucket]:>8} {bar}")
+
+        return '\n'.join(lines + [''] + histograms)
+
+
+class ThreadProfiles:
+    """
+    cProfile для основного и рабочих потоков.
+
+    До Python 3.12 cProfile.Profile учитывает только поток, в котором он включен, поэтому
+    функции, выполняемые в пуле потоков, оборачиваются в профилировщик своего потока;
+    при сохранении статистика всех потоков объединяется. Начиная с 3.12 профилировщик
+    основного потока (sys.monitoring) видит все потоки, а второй профилировщик включить
+    нельзя (ValueError), поэтому обертка не нужна.
+    """
+
+    # Версия, с которой один профилировщик охватывает все потоки
+    ALL_THREADS_VERSION = (3, 12)
+
+    def __init__(self):
+        self.main = cProfile.Profile()
+        self.local = threading.local()
+        self.profiles = [self.main]
+        self.lock = threading.Lock()
+
+    def wrap(self, func: Callable) -> Callable:
+        """Оборачивает функцию так, чтобы ее вызовы в рабочих потоках попадали в статистику"""
+        if sys.version_info >= self.ALL_THREADS_VERSION:
+            return func
+
+        def wrapper(*args, **kwargs):
+            # Основной поток уже профилируется self.main
+            if threading.current_thread() is threading.main_thread():
+                return func(*args, **kwargs)
+
+            profile = getattr(self.local, 'profile', None)
+            if profile is None:
+                profile = self.local.profile = cProfile.Profile()
+                with self.lock:
+                    self.profiles.append(profile)
+
+            profile.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+
+        return wrapper
+
+    def dump_stats(self, path: str):
+        """Сохраняет объединенную статистику всех потоков в файл для pstats"""
+        stats = None
+        for profile in self.profiles:
+            profile.create_stats()
+            if not profile.stats:
+                continue
+            if stats is None:
+                stats = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+        if stats is not None:
+            stats.dump_stats(path)
+
+
+# Шаблоны извлечения номера трека из имени файла (без расширения), в порядке приоритета:
+# "CD1-03 x", "[03] x", "01 - x" / "01. x", "x - 01".
+# Шаблоны проверяются по очереди, побеждает первый сработавший (а не самое левое совпадение)
+TRACK_PATTERNS = (
+    ('disc', r'^(?:cd|disc|disk)\s*\d+\s*[-_. ]\s*(?P<n>\d{1,3})(?!\d)'),
+    # Только в начале имени: "(1)" в конце - обычный суффикс копии при скачивании
+    ('bracket', r'^[\[(](?P<n>\d{1,3})[\])]'),
+    ('leading', r'^(?P<n>\d{1,3})(?=[\s._)\-]|$)'),
+    # Только через разделитель " - ", чтобы "Blink-182" и "Apollo 13" не считались номерами
+    ('trailing', r'\s-\s+(?P<n>\d{1,3})$'),
+)
+
+TRACK_REGEXES = tuple((name, re.compile(pattern, re.IGNORECASE)) for name, pattern in TRACK_PATTERNS)
+
+
+@lru_cache(maxsize=256)
+def directory_track_order(directory: str) -> Dict[str, int]:
+    """
+    Возвращает порядковые номера mp3-файлов директории в отсортированном порядке.
+
+    Каталог читается один раз, результат кэшируется для следующих файлов той же директории
+    (в режиме --watch кэш сбрасывается, когда в библиотеке появляются новые файлы).
+
+    Args:
+        directory: Директория с MP3 файлами
+
+    Returns:
+        Словарь {имя файла: номер, начиная с 1}
+    """
+    names = sorted(entry.name for entry in iter_mp3_files(directory))
+    return {name: position for position, name in enumerate(names, start=1)}
+
+
+def infer_track_number(file_path: str, use_order: bool = False) -> Tuple[int, str]:
+    """
+    Определяет номер трека по имени файла.
+
+    Args:
+        file_path: Путь к MP3 файлу
+        use_order: Если шаблоны не подошли, брать номер по порядку файла в директории
+
+    Returns:
+        Кортеж (номер трека 1-255 или 0, если определить не удалось; способ определения)
+    """
+    directory, filename = os.path.split(file_path)
+    stem = os.path.splitext(filename)[0].strip()
+
+    for name, regex in TRACK_REGEXES:
+        match = regex.search(stem)
+        if match:
+            track_num = int(match.group('n'))
+            if track_num > 0:
+                return min(track_num, 255), name
+
+    if use_order:
+        position = directory_track_order(directory).get(filename, 0)
+        if 0 < position <= 255:
+            return position, 'order'
+
+    return 0, ''
+
+
+def plan_tag_updates(tag_info: Dict, file_path: str, args: argparse.Namespace,
+                     genre_rules: Optional['GenreRules'] = None) -> List[str]:
+    """
+    Проставляет в словаре тега недостающие номер трека и жанр.
+
+    Args:
+        tag_info: Словарь с тегами (изменяется на месте)
+        file_path: Путь к файлу, по имени которого определяется номер трека
+        args: Аргументы командной строки
+        genre_rules: Правила жанров (--genre-rules) или None
+
+    Returns:
+        Список сообщений о внесенных изменениях (пустой, если менять нечего)
+    """
+    messages = []
+
+    if tag_info['track'] == 0:
+        # Номер трека извлекается из имени файла, например "01 - Название трека.mp3"
+        track_num, source = infer_track_number(file_path, args.track_order)
+        if track_num:
+            tag_info['track'] = track_num
+            messages.append(f"Проставлен номер трека: {track_num} (источник: {source})")
+
+    # Жанр 255 означает "не задан"; сначала проверяются правила, затем --genre
+    if tag_info['genre'] == 255:
+        rule = genre_rules.match(file_path, tag_info['artist']) if genre_rules is not None else None
+        if rule is not None and rule[0] != 255:
+            tag_info['genre'] = rule[0]
+            messages.append(f"Проставлен жанр: {rule[0]} {genre_name(rule[0])} (правило: {rule[1]})")
+        elif args.genre != 255:
+            # Проставлять тот же 255 повторно нет смысла
+            tag_info['genre'] = args.genre
+            messages.append(f"Проставлен жанр: {args.genre}")
+
+    return messages
+
+
+def process_file(file_path: str, args: argparse.Namespace, index: Optional[TagIndex] = None,
+                 file_stat: Optional[os.stat_result] = None, genre_rules: Optional['GenreRules'] = None,
+                 profiler=NULL_PROFILER) -> Dict:
+    """
+    Обрабатывает один MP3 файл: читает тег, при необходимости проставляет номер трека и жанр.
+
+    Чтение, изменение и запись тега выполняются через один открытый дескриптор.
+
+    Args:
+        file_path: Путь к MP3 файлу
+        args: Аргументы командной строки
+        index: Индекс тегов (если None, тег всегда читается из файла)
+        file_stat: Результат stat для файла (используется индексом)
+        genre_rules: Правила жанров (--genre-rules) или None
+        profiler: Профилировщик этапов (StageProfiler или NULL_PROFILER)
+
+    Returns:
+        Результат обработки: путь, состояние (unchanged, updated, update_failed, dry_run,
+        no_tag, id3v2_only, read_error), итоговые теги, список изменений и строки
+        текстового вывода (собираются здесь, чтобы параллельные потоки не перемешивали вывод)
+    """
+    filename = os.path.basename(file_path)
+    lines = []
+    messages = []
+    status = 'unchanged'
+    f = None
+
+    try:
+        # Получаем теги: из индекса, если файл не менялся, иначе из самого файла
+        cached = None
+        if index is not None:
+            with profiler.stage('index'):
+                if file_stat is None:
+                    file_stat = os.stat(file_path)
+                cached = index.lookup(file_path, file_stat)
+
+        if cached is not None:
+            tag_info, tag_data = cached
+        else:
+            with profiler.stage('read'):
+                f = open_tag_file(file_path, writable=not args.dry_run)
+                tag_data = read_tail_block(f)
+            with profiler.stage('decode'):
+                tag_info = parse_id3v1_tag(tag_data)
+            if tag_info is None:
+                tag_data = b''
+            if index is not None:
+                index.store(file_path, file_stat, tag_info, tag_data)
+    except Exception as e:
+        # Ошибки чтения в индекс не попадают, файл будет прочитан в следующий раз
+        lines.append(f"Ошибка при чтении файла {file_path}: {e}")
+        tag_info, tag_data = None, b''
+        status = 'read_error'
+
+    # ID3v2 читается через тот же дескриптор, если файл уже открыт;
+    # выводятся объединенные данные, а обновляется по-прежнему ID3v1
+    v2_info = None
+    if args.id3v2:
+        try:
+            if f is not None:
+                v2_info = read_id3v2_tag(f)
+            else:
+                with open(file_path, 'rb') as v2_file:
+                    v2_info = read_id3v2_tag(v2_file)
+        except Exception as e:
+            lines.append(f"Ошибка при чтении ID3v2 из файла {file_path}: {e}")
+
+    def merged_view() -> Optional[Dict]:
+        # Объединение строится по текущему состоянию tag_info (в том числе после простановки трека и жанра)
+        return merge_id3_tags(tag_info, v2_info) if v2_info is not None else tag_info
+
+    display_info = merged_view()
+
+    try:
+        if tag_info:
+            # Выводим информацию о файле
+            lines.append(f"{display_info['artist']} - {display_info['title']} - {display_info['album']}")
+
+            # Если запрошен дамп, выводим его
+            if args.dump:
+                lines.append("Дамп ID3v1-тега:")
+                lines.append(hex_dump(tag_data))
+                lines.append("")
+
+            # Проверяем, нужно ли проставить трек или жанр
+            messages = plan_tag_updates(tag_info, file_path, args, genre_rules)
+            lines.extend(messages)
+            if messages:
+                display_info = merged_view()
+
+            # Если нужно обновить теги, делаем это
+            if messages and args.dry_run:
+                lines.append(f"Файл {filename} будет обновлен (пробный запуск, запись не выполнялась)")
+                status = 'dry_run'
+            elif messages:
+                if f is not None and f.writable():
+                    # Файл уже открыт на запись - дописываем тег через тот же дескриптор
+                    try:
+                        with profiler.stage('encode'):
+                            new_tag = build_id3v1_tag(tag_info, args.encoding)
+                        with profiler.stage('write'):
+                            write_tag_block(f, new_tag, has_tag=True)
+                        if index is not None:
+                            index.store(file_path, os.fstat(f.fileno()), parse_id3v1_tag(new_tag), new_tag)
+                        updated = True
+                    except Exception as e:
+                        lines.append(f"Ошибка при записи тега в файл {file_path}: {e}")
+                        updated = False
+                else:
+                    with profiler.stage('write'):
+                        updated = write_id3v1_tag(file_path, tag_info, args.encoding)
+                    if updated and index is not None:
+                        index.forget(file_path)
+
+                if updated:
+                    lines.append(f"Файл {filename} обновлен успешно")
+                    status = 'updated'
+                else:
+                    lines.append(f"Не удалось обновить теги в файле {filename}")
+                    status = 'update_failed'
+
+            lines.append("---")
+        elif display_info:
+            lines.append(f"{display_info['artist']} - {display_info['title']} - {display_info['album']}")
+            lines.append(f"Файл {filename} содержит только ID3v2-тег")
+            lines.append("---")
+            status = 'id3v2_only'
+        else:
+            lines.append(f"Файл {filename} не содержит ID3v1-тегов")
+            lines.append("---")
+            if status != 'read_error':
+                status = 'no_tag'
+    finally:
+        if f is not None:
+            f.close()
+
+    return {
+        'path': file_path,
+        'status': status,
+        'tag': display_info,
+        # Кодировка нужна только сводной статистике; без --summary chardet не вызывается,
+        # чтобы ответы из индекса не требовали повторного определения кодировки
+        'encoding': detect_block_encoding(tag_data) if tag_data and args.summary else None,
+        'changes': messages,
+        'lines': lines
+    }
+
+
+# Форматы вывода результатов обработки
+OUTPUT_FORMATS = ('text', 'jsonl', 'csv')
+
+# Колонки CSV-вывода
+CSV_COLUMNS = ('path', 'status', 'artist', 'title', 'album', 'year', 'comment', 'track', 'genre', 'changes')
+
+
+class ResultWriter:
+    """
+    Потоковый вывод результатов process_file в текстовом виде, JSONL или CSV.
+
+    Записи накапливаются в буфере и сбрасываются в поток пачками,
+    поэтому в памяти одновременно находится не больше одной пачки.
+    """
+
+    def __init__(self, stream, output_format: str = 'text', batch_size: int = 500,
+                 summary: Optional['LibrarySummary'] = None):
+        self.stream = stream
+        self.output_format = output_format
+        self.batch_size = batch_size
+        self.summary = summary
+        self.buffer = io.StringIO()
+        self.buffered = 0
+        self.csv_writer = csv.writer(self.buffer) if output_format == 'csv' else None
+
+        if self.csv_writer is not None:
+            self.csv_writer.writerow(CSV_COLUMNS)
+
+    def write(self, result: Dict):
+        """Добавляет результат обработки файла в вывод"""
+        # Все режимы обработки проходят через писатель, поэтому статистика копится здесь же
+        if self.summary is not None:
+            self.summary.add(result)
+
+        if self.output_format == 'text':
+            self.buffer.write('\n'.join(result['lines']) + '\n')
+        else:
+            tag = result['tag'] or {}
+            record = {'path': result['path'], 'status': result['status']}
+            for field in ('artist', 'title', 'album', 'year', 'comment', 'track', 'genre'):
+                record[field] = tag.get(field)
+
+            if self.output_format == 'jsonl':
+                record['changes'] = result['changes']
+                self.buffer.write(json.dumps(record, ensure_ascii=False) + '\n')
+            else:
+                record['changes'] = '; '.join(result['changes'])
+                self.csv_writer.writerow([record[column] for column in CSV_COLUMNS])
+
+        self.buffered += 1
+        # Текстовый вывод предназначен для человека и выводится сразу
+        if self.output_format == 'text' or self.buffered >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Сбрасывает накопленную пачку в поток"""
+        self.stream.write(self.buffer.getvalue())
+        self.stream.flush()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        self.buffered = 0
+
+    def close(self):
+        """Выводит остаток буфера"""
+        self.flush()
+
+
+class LibrarySummary:
+    """
+    Потоковые счетчики по библиотеке, собираемые во время основного прохода.
+
+    Каждый результат process_file учитывается один раз, повторного обхода файлов не требуется.
+    """
+
+    def __init__(self):
+        self.files = 0
+        self.statuses = Counter()
+        self.artists = Counter()
+        self.albums = Counter()
+        self.years = Counter()
+        self.genres = Counter()
+        self.encodings = Counter()
+
+    def add(self, result: Dict):
+        """Учитывает результат обработки одного файла"""
+        self.files += 1
+        self.statuses[result['status']] += 1
+
+        if result['encoding']:
+            self.encodings[result['encoding']] += 1
+
+        tag = result['tag']
+        if not tag:
+            return
+        self.artists[tag['artist']] += 1
+        self.albums[f"{tag['artist']} - {tag['album']}"] += 1
+        self.years[tag['year']] += 1
+        self.genres[f"{tag['genre']} {genre_name(tag['genre'])}".strip()] += 1
+
+    def to_dict(self) -> Dict:
+        """Возвращает статистику в виде словаря для сохранения в JSON"""
+        without_tags = self.statuses['no_tag'] + self.statuses['read_error']
+        return {
+            'files': self.files,
+            'files_without_tags': without_tags,
+            'missing_tags_share': without_tags / self.files if self.files else 0.0,
+            'statuses': dict(self.statuses),
+            'encodings': dict(self.encodings.most_common()),
+            'genres': dict(self.genres.most_common()),
+            'years': dict(sorted(self.years.items())),
+            'artists': dict(self.artists.most_common()),
+            'albums': dict(self.albums.most_common())
+        }
+
+    def save(self, destination: str, stream):
+        """
+        Сохраняет статистику в JSON файл или выводит ее в поток.
+
+        Args:
+            destination: Путь к файлу или '-' для вывода в поток
+            stream: Поток для вывода статистики и сообщений
+        """
+        report = self.to_dict()
+        if destination == '-':
+            print(json.dumps(report, ensure_ascii=False, indent=2), file=stream)
+        else:
+            with open(destination, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"Сводная статистика сохранена в {destination}", file=stream)
+
+
+def run_ordered(func: Callable, items: Iterable, jobs: int = 1) -> Iterator:
+    """
+    Применяет функцию к элементам, при jobs > 1 - в пуле потоков.
+
+    Результаты выдаются строго в порядке входных элементов. Одновременно в работе
+    держится не более jobs * 4 задач, поэтому память не растет с размером входа.
+
+    Args:
+        func: Функция от одного элемента
+        items: Входные элементы
+        jobs: Количество рабочих потоков
+
+    Returns:
+        Итератор результатов в исходном порядке
+    """
+    if jobs <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(func, item))
+            # Ограничиваем число задач в работе и сразу отдаем готовые по порядку
+            if len(pending) >= jobs * 4:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+async def run_ordered_async(func: Callable, items: Iterator, max_inflight: int = 64) -> AsyncIterator:
+    """
+    Асинхронный аналог run_ordered: блокирующие вызовы выполняются в пуле потоков,
+    а число одновременно выполняемых операций ограничено max_inflight.
+
+    Следующий элемент входного итератора тоже запрашивается в пуле, поэтому медленный
+    обход каталога (например, на FUSE-монтировании) не блокирует цикл событий.
+
+    Args:
+        func: Блокирующая функция от одного элемента
+        items: Входной итератор
+        max_inflight: Максимальное число операций в работе
+
+    Returns:
+        Асинхронный итератор результатов в исходном порядке
+    """
+    loop = asyncio.get_running_loop()
+    sentinel = object()
+
+    with ThreadPoolExecutor(max_workers=max_inflight) as executor:
+        pending = deque()
+        while True:
+            item = await loop.run_in_executor(executor, next, items, sentinel)
+            if item is sentinel:
+                break
+            pending.append(loop.run_in_executor(executor, func, item))
+            if len(pending) >= max_inflight:
+                yield await pending.popleft()
+        while pending:
+            yield await pending.popleft()
+
+
+async def print_results_async(func: Callable, items: Iterator, max_inflight: int, writer: 'ResultWriter') -> int:
+    """
+    Выводит результаты обработки файлов из асинхронного конвейера.
+
+    Args:
+        func: Функция обработки файла (возвращает результат process_file)
+        items: Входной итератор
+        max_inflight: Максимальное число операций в работе
+        writer: Писатель результатов
+
+    Returns:
+        Количество обработанных файлов
+    """
+    processed = 0
+    async for result in run_ordered_async(func, items, max_inflight):
+        writer.write(result)
+        processed += 1
+    return processed
+
+
+class TagWatcher:
+    """
+    Слежение за директорией и обработка новых и измененных mp3-файлов.
+
+    Изменения берутся из watchdog (inotify и аналоги), если библиотека установлена,
+    иначе - периодическим опросом каталога. Опрос - это полный обход дерева (stat каждого
+    файла), поэтому без watchdog он выполняется раз в scan_interval секунд, а не каждую
+    секунду; новые файлы в этом режиме подхватываются с задержкой до scan_interval + debounce.
+    Файл обрабатывается, только когда его размер и время изменения не меняются в течение
+    интервала debounce (копирование завершено). Задачи передаются рабочим потокам через
+    ограниченную очередь; файлы, уже стоящие в очереди или в обработке, повторно не ставятся.
+    """
+
+    def __init__(self, args: argparse.Namespace, writer: 'ResultWriter', index: Optional[TagIndex] = None,
+                 debounce: float = 2.0, interval: float = 1.0, queue_size: int = 1000,
+                 genre_rules: Optional['GenreRules'] = None, scan_interval: float = 10.0):
+        self.args = args
+        self.writer = writer
+        self.index = index
+        self.genre_rules = genre_rules
+        self.debounce = debounce
+        self.interval = interval
+        self.scan_interval = scan_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        # Состояние (размер, mtime) файлов после последней обработки
+        self.known: Dict[str, Tuple[int, int]] = {}
+        # Ожидающие стабилизации файлы: путь -> (состояние, время первого наблюдения)
+        self.pending: Dict[str, Tuple[Tuple[int, int], float]] = {}
+        # Пути из событий watchdog, которые нужно проверить
+        self.candidates = set()
+        # Файлы, поставленные в очередь и еще не обработанные
+        self.in_flight = set()
+        self.observer = None
+        self.processed = 0
+
+    @staticmethod
+    def file_state(file_stat: os.stat_result) -> Tuple[int, int]:
+        return file_stat.st_size, file_stat.st_mtime_ns
+
+    def snapshot(self) -> Dict[str, Tuple[int, int]]:
+        """Текущее состояние всех mp3-файлов директории"""
+        states = {}
+        for entry in iter_mp3_files(self.args.directory, self.args.recursive):
+            try:
+                states[entry.path] = self.file_state(entry.stat())
+            except OSError:
+                continue
+        return states
+
+    def start_observer(self) -> bool:
+        """Запускает watchdog, если он доступен"""
+        if Observer is None:
+            return False
+
+        watcher = self
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.is_directory:
+                    return
+                for path in (event.src_path, getattr(event, 'dest_path', '')):
+                    if path and path.lower().endswith('.mp3'):
+                        with watcher.lock:
+                            watcher.candidates.add(path)
+
+        self.observer = Observer()
+        self.observer.schedule(Handler(), self.args.directory, recursive=self.args.recursive)
+        self.observer.start()
+        return True
+
+    def changed_states(self) -> Dict[str, Tuple[int, int]]:
+        """Состояния файлов, которые могли измениться с прошлой проверки"""
+        if self.observer is None:
+            return self.snapshot()
+
+        with self.lock:
+            paths, self.candidates = self.candidates, set()
+        paths.update(self.pending)
+
+        states = {}
+        for path in paths:
+            try:
+                states[path] = self.file_state(os.stat(path))
+            except OSError:
+                self.pending.pop(path, None)
+        return states
+
+    def poll(self):
+        """Одна проверка: новые файлы ставятся в ожидание, стабильные - в очередь обработки"""
+        now = time.monotonic()
+        for path, state in self.changed_states().items():
+            with self.lock:
+                if path in self.in_flight:
+                    # Файл уже в очереди; после обработки его состояние попадет в known
+                    continue
+                if self.known.get(path) == state:
+                    # Файл вернулся к обработанному состоянию - ждать больше нечего
+                    self.pending.pop(path, None)
+                    continue
+                is_new = path not in self.known
+
+            waiting = self.pending.get(path)
+            if waiting is None or waiting[0] != state:
+                self.pending[path] = (state, now)
+            elif now - waiting[1] >= self.debounce:
+                del self.pending[path]
+                if is_new:
+                    # В директории появился файл - порядок файлов для --track-order устарел
+                    directory_track_order.cache_clear()
+                with self.lock:
+                    self.in_flight.add(path)
+                # При заполненной очереди опрос приостанавливается (обратное давление)
+                self.queue.put(path)
+
+    def worker(self):
+        """Рабочий поток: обрабатывает файлы из очереди"""
+        while True:
+            path = self.queue.get()
+            if path is None:
+                return
+
+            result = process_file(path, self.args, self.index, genre_rules=self.genre_rules)
+            with self.lock:
+                # Запоминаем состояние после собственной записи, чтобы не обработать файл повторно
+                try:
+                    self.known[path] = self.file_state(os.stat(path))
+                except OSError:
+                    self.known.pop(path, None)
+                self.in_flight.discard(path)
+                self.writer.write(result)
+                self.processed += 1
+
+    def run(self):
+        """Запускает слежение до прерывания (Ctrl+C)"""
+        self.known = self.snapshot()
+        backend = 'watchdog' if self.start_observer() else 'опрос каталога'
+        print(f"Слежение за {self.args.directory} ({backend}), файлов на старте: {len(self.known)}. "
+              f"Для остановки нажмите Ctrl+C", file=sys.stderr)
+
+        workers = [threading.Thread(target=self.worker, daemon=True) for _ in range(self.args.jobs)]
+        for thread in workers:
+            thread.start()
+
+        # Без watchdog каждая проверка - полный обход дерева, поэтому она выполняется реже
+        interval = self.interval if self.observer is not None else self.scan_interval
+        try:
+            while True:
+                self.poll()
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if self.observer is not None:
+                self.observer.stop()
+                self.observer.join()
+            for _ in workers:
+                self.queue.put(None)
+            for thread in workers:
+                thread.join()
+
+
+# Текстовые поля ID3v1: (начало, конец) в 128-байтном блоке; комментарий зависит от версии тега
+ID3V1_TEXT_FIELDS = ((3, 33), (33, 63), (63, 93), (93, 97))
+
+
+def iter_directories(directory: str, recursive: bool = False) -> Iterator[str]:
+    """
+    Перечисляет директорию и (при recursive) все вложенные директории.
+
+    Args:
+        directory: Корневая директория
+        recursive: Обходить ли вложенные директории
+
+    Returns:
+        Итератор путей директорий
+    """
+    yield directory
+    if not recursive:
+        return
+    try:
+        with os.scandir(directory) as entries:
+            subdirectories = [entry.path for entry in entries if entry.is_dir(follow_symlinks=False)]
+    except OSError as e:
+        print(f"Ошибка при чтении директории {directory}: {e}", file=sys.stderr)
+        return
+    for subdirectory in subdirectories:
+        yield from iter_directories(subdirectory, recursive)
+
+
+def tag_text_regions(tag_data: bytes) -> List[Tuple[int, int]]:
+    """Возвращает области текстовых полей тега с учетом версии (v1.0 или v1.1)"""
+    comment_end = 125 if tag_data[125] == 0 else 127
+    return list(ID3V1_TEXT_FIELDS) + [(97, comment_end)]
+
+
+def detect_directory_encoding(sample: bytes) -> str:
+    """
+    Определяет исходную кодировку тегов директории для перекодировки.
+
+    На коротких русских текстах chardet часто не уверен в выборе между
+    windows-1251 и koi8-r. В этом случае решает регистр: в windows-1251 строчные
+    буквы занимают 0xE0-0xFF, а в koi8-r - 0xC0-0xDF, и строчных в тексте больше.
+
+    Args:
+        sample: Объединенные байты текстовых полей всех тегов директории
+
+    Returns:
+        Строка с названием кодировки
+    """
+    detection = chardet.detect(sample)
+    encoding = (detection['encoding'] or '').lower()
+
+    if encoding in ('koi8-r', 'windows-1251') and detection['confidence'] < 0.6:
+        lower_cp1251 = sum(1 for b in sample if b >= 0xE0)
+        lower_koi8 = sum(1 for b in sample if 0xC0 <= b < 0xE0)
+        return 'windows-1251' if lower_cp1251 >= lower_koi8 else 'koi8-r'
+
+    return detect_encoding(sample)
+
+
+def transcode_tag_block(tag_data: bytes, source: str, target: str) -> Optional[bytes]:
+    """
+    Перекодирует текстовые поля тега из одной кодировки в другую.
+
+    Меняются только байты текстовых полей, номер трека, жанр и формат
+    комментария (v1.0/v1.1) сохраняются как есть.
+
+    Args:
+        tag_data: Исходный 128-байтный блок тега
+        source: Исходная кодировка
+        target: Целевая кодировка
+
+    Returns:
+        Новый блок тега или None, если текст не представим в целевой кодировке
+        или не помещается в поле (многобайтные кодировки длиннее исходных)
+    """
+    new_tag = bytearray(tag_data)
+    for start, end in tag_text_regions(tag_data):
+        raw = tag_data[start:end].rstrip(b'\x00')
+        try:
+            encoded = raw.decode(source).encode(target)
+        except (UnicodeDecodeError, UnicodeEncodeError):
+            return None
+        if len(encoded) > end - start:
+            # Обрезка могла бы разрезать многобайтный символ - такой тег не перезаписывается
+            return None
+        new_tag[start:end] = encoded.ljust(end - start, b'\x00')
+    return bytes(new_tag)
+
+
+def transcode_file(file_path: str, tag_data: bytes, source: str, target: str, dry_run: bool = False) -> Tuple[str, str]:
+    """
+    Перезаписывает тег файла в целевой кодировке с проверочным чтением.
+
+    Args:
+        file_path: Путь к MP3 файлу
+        tag_data: Исходный блок тега (прочитанный при анализе директории)
+        source: Исходная кодировка
+        target: Целевая кодировка
+        dry_run: Только проверить, ничего не записывая
+
+    Returns:
+        Кортеж (состояние: unchanged, transcoded, dry_run, failed; строка для вывода)
+    """
+    filename = os.path.basename(file_path)
+    new_tag = transcode_tag_block(tag_data, source, target)
+
+    if new_tag is None:
+        return 'failed', f"Файл {filename}: текст не представим в кодировке {target} или не помещается в поле"
+    if new_tag == tag_data:
+        return 'unchanged', ''
+    if dry_run:
+        return 'dry_run', f"Файл {filename}: {source} -> {target} (пробный запуск)"
+
+    try:
+        with open(file_path, 'r+b') as f:
+            # Файл мог измениться после анализа - в этом случае его не трогаем
+            if read_tail_block(f) != tag_data:
+                return 'failed', f"Файл {filename} изменен во время перекодировки, пропущен"
+            write_tag_block(f, new_tag, has_tag=True)
+            if read_tail_block(f) != new_tag:
+                return 'failed', f"Файл {filename}: проверочное чтение не совпало с записанным тегом"
+    except Exception as e:
+        return 'failed', f"Ошибка при записи тега в файл {file_path}: {e}"
+
+    return 'transcoded', f"Файл {filename}: {source} -> {target}"
+
+
+def transcode_library(args: argparse.Namespace) -> Dict[str, int]:
+    """
+    Перекодирует теги библиотеки в кодировку args.transcode.
+
+    Исходная кодировка определяется один раз на директорию по объединенным
+    байтам всех ее тегов (или задается --source-encoding). Чтение и запись
+    выполняются в пуле потоков, переписываются только изменившиеся теги.
+
+    Args:
+        args: Аргументы командной строки
+
+    Returns:
+        Счетчики по состояниям файлов
+    """
+    counts = {'directories': 0, 'files': 0, 'unchanged': 0, 'transcoded': 0, 'dry_run': 0, 'failed': 0}
+
+    def read(entry: os.DirEntry) -> Tuple[str, Optional[bytes]]:
+        try:
+            tag_data = read_id3v1_block(entry.path)
+        except Exception as e:
+            print(f"Ошибка при чтении файла {entry.path}: {e}", file=sys.stderr)
+            return entry.path, None
+        return entry.path, tag_data if tag_data[:3] == b'TAG' and len(tag_data) == 128 else None
+
+    for directory in iter_directories(args.directory, args.recursive):
+        tags = [(path, tag_data) for path, tag_data in run_ordered(read, iter_mp3_files(directory), args.jobs)
+                if tag_data is not None]
+        if not tags:
+            continue
+        counts['directories'] += 1
+        counts['files'] += len(tags)
+
+        source = args.source_encoding
+        if source is None:
+            sample = b' '.join(tag_data[start:end].rstrip(b'\x00')
+                               for _, tag_data in tags for start, end in tag_text_regions(tag_data))
+            if sample.isascii():
+                # Только ASCII - перекодировать нечего
+                counts['unchanged'] += len(tags)
+                continue
+            source = detect_directory_encoding(sample)
+
+        def convert(item: Tuple[str, bytes]) -> Tuple[str, str]:
+            return transcode_file(item[0], item[1], source, args.transcode, args.dry_run)
+
+        for status, line in run_ordered(convert, tags, args.jobs):
+            counts[status] += 1
+            if line:
+                print(line)
+
+    return counts
+
+
+# Состояния записей журнала пакетного обновления
+JOURNAL_PLANNED = 'planned'
+JOURNAL_DONE = 'done'
+JOURNAL_CONFLICT = 'conflict'
+JOURNAL_ROLLED_BACK = 'rolled_back'
+
+
+class TagJournal:
+    """
+    Журнал пакетного обновления тегов в SQLite.
+
+    Для каждого файла хранится исходный и новый 128-байтный блок тега и состояние
+    записи. По журналу прерванное обновление продолжается без повторного чтения
+    уже обработанных файлов, а примененные изменения можно откатить.
+    """
+
+    def __init__(self, db_path: str):
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.pending = 0
+
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS entries (
+            id INTEGER PRIMARY KEY,
+            path TEXT UNIQUE NOT NULL,
+            old_tag BLOB NOT NULL,
+            new_tag BLOB NOT NULL,
+            status TEXT NOT NULL
+        )
+        ''')
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+        ''')
+        self.conn.commit()
+
+    def contains(self, file_path: str) -> bool:
+        """Проверяет, запланирован ли уже файл"""
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM entries WHERE path = ?", (file_path,)).fetchone() is not None
+
+    def add(self, file_path: str, old_tag: bytes, new_tag: bytes):
+        """Записывает в журнал запланированное изменение тега"""
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO entries (path, old_tag, new_tag, status) VALUES (?, ?, ?, ?)",
+                (file_path, old_tag, new_tag, JOURNAL_PLANNED)
+            )
+            self._commit_periodically()
+
+    def set_status(self, entry_id: int, status: str):
+        """Обновляет состояние записи журнала"""
+        with self.lock:
+            self.conn.execute("UPDATE entries SET status = ? WHERE id = ?", (status, entry_id))
+            self._commit_periodically()
+
+    def iter_entries(self, *statuses: str, batch_size: int = 1000) -> Iterator[Tuple[int, str, bytes, bytes]]:
+        """
+        Перебирает записи с указанными состояниями порциями по id.
+
+        Args:
+            statuses: Состояния записей
+            batch_size: Размер порции
+
+        Returns:
+            Итератор кортежей (id, путь, исходный тег, новый тег)
+        """
+        placeholders = ', '.join('?' * len(statuses))
+        last_id = 0
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    f"SELECT id, path, old_tag, new_tag FROM entries WHERE status IN ({placeholders}) AND id > ? "
+                    f"ORDER BY id LIMIT ?",
+                    (*statuses, last_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield row[0], row[1], bytes(row[2]), bytes(row[3])
+            last_id = rows[-1][0]
+
+    def is_scan_complete(self) -> bool:
+        """Проверяет, завершено ли планирование (обход директории)"""
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'scan_complete'").fetchone()
+        return row is not None and row[0] == '1'
+
+    def mark_scan_complete(self):
+        """Отмечает, что все файлы директории запланированы"""
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('scan_complete', '1')")
+            self.conn.commit()
+            self.pending = 0
+
+    def counts(self) -> Dict[str, int]:
+        """Возвращает количество записей по состояниям"""
+        with self.lock:
+            return dict(self.conn.execute("SELECT status, COUNT(*) FROM entries GROUP BY status").fetchall())
+
+    def _commit_periodically(self):
+        # После сбоя часть последних отметок может потеряться: файл уже перезаписан, а запись
+        # осталась в состоянии planned. При продолжении такие файлы распознаются по уже
+        # записанному новому тегу, а откат поэтому проходит и по planned, и по done
+        self.pending += 1
+        if self.pending >= 100:
+            self.conn.commit()
+            self.pending = 0
+
+    def close(self):
+        """Фиксирует изменения и закрывает журнал"""
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+
+def plan_journal_entry(file_path: str, args: argparse.Namespace, journal: TagJournal,
+                       genre_rules: Optional['GenreRules'] = None) -> List[str]:
+    """
+    Читает тег файла и заносит в журнал запланированное изменение, если оно нужно.
+
+    Args:
+        file_path: Путь к MP3 файлу
+        args: Аргументы командной строки
+        journal: Журнал обновления
+        genre_rules: Правила жанров (--genre-rules) или None
+
+    Returns:
+        Список строк для вывода
+    """
+    filename = os.path.basename(file_path)
+
+    # Файлы, уже попавшие в журнал до сбоя, повторно не читаются
+    if journal.contains(file_path):
+        return []
+
+    try:
+        old_tag = read_id3v1_block(file_path)
+    except Exception as e:
+        return [f"Ошибка при чтении файла {file_path}: {e}"]
+
+    tag_info = parse_id3v1_tag(old_tag)
+    if tag_info is None:
+        return []
+
+    messages = plan_tag_updates(tag_info, file_path, args, genre_rules)
+    if not messages:
+        return []
+
+    journal.add(file_path, old_tag, build_id3v1_tag(tag_info, args.encoding))
+    return [f"Запланировано обновление {filename}: " + "; ".join(messages)]
+
+
+def swap_journal_tag(entry: Tuple[int, str, bytes, bytes], journal: TagJournal, rollback: bool = False) -> str:
+    """
+    Заменяет тег файла по записи журнала (применение или откат).
+
+    Перед записью проверяется текущий тег: если в файле уже целевой тег,
+    запись не выполняется; если тег отличается от ожидаемого, файл не трогается.
+
+    Args:
+        entry: Запись журнала (id, путь, исходный тег, новый тег)
+        journal: Журнал обновления
+        rollback: True - вернуть исходный тег, False - записать новый
+
+    Returns:
+        Строка для вывода
+    """
+    entry_id, file_path, old_tag, new_tag = entry
+    expected, target = (new_tag, old_tag) if rollback else (old_tag, new_tag)
+    done_status = JOURNAL_ROLLED_BACK if rollback else JOURNAL_DONE
+    filename = os.path.basename(file_path)
+
+    try:
+        with open(file_path, 'r+b') as f:
+            current = read_tail_block(f)
+            if current == target:
+                # Запись была выполнена до сбоя, но отметка в журнале не сохранилась
+                journal.set_status(entry_id, done_status)
+                return f"Файл {filename} уже в нужном состоянии"
+            if current != expected:
+                if not rollback:
+                    journal.set_status(entry_id, JOURNAL_CONFLICT)
+                return f"Файл {filename} изменен после планирования, пропущен"
+            write_tag_block(f, target, has_tag=True)
+    except Exception as e:
+        return f"Ошибка при записи тега в файл {file_path}: {e}"
+
+    journal.set_status(entry_id, done_status)
+    if rollback:
+        return f"Файл {filename}: исходный тег восстановлен"
+    return f"Файл {filename} обновлен успешно"
+
+
+def run_journaled(args: argparse.Namespace, genre_rules: Optional['GenreRules'] = None):
+    """
+    Пакетное обновление тегов через журнал: планирование, затем применение.
+
+    Повторный запуск с тем же журналом продолжает прерванное обновление.
+
+    Args:
+        args: Аргументы командной строки
+        genre_rules: Правила жанров (--genre-rules) или None
+    """
+    journal = TagJournal(args.journal)
+    start_time = time.perf_counter()
+
+    try:
+        if args.rollback:
+            # planned тоже откатывается: отметка done могла не сохраниться до сбоя;
+            # файлы, где еще исходный тег, swap_journal_tag просто отметит как откаченные
+            for line in run_ordered(lambda entry: swap_journal_tag(entry, journal, rollback=True),
+                                    journal.iter_entries(JOURNAL_PLANNED, JOURNAL_DONE), args.jobs):
+                print(line)
+        else:
+            # Этап 1: планирование (пропускается, если обход уже был завершен)
+            if not journal.is_scan_complete():
+                if args.directory is None:
+                    print("Ошибка: журнал не содержит завершенного плана, укажите директорию")
+                    return
+                entries = iter_mp3_files(args.directory, args.recursive)
+                for lines in run_ordered(lambda entry: plan_journal_entry(entry.path, args, journal, genre_rules),
+                                         entries, args.jobs):
+                    for line in lines:
+                        print(line)
+                journal.mark_scan_complete()
+
+            # Этап 2: применение запланированных изменений
+            if not args.dry_run:
+                for line in run_ordered(lambda entry: swap_journal_tag(entry, journal),
+                                        journal.iter_entries(JOURNAL_PLANNED), args.jobs):
+                    print(line)
+
+        counts = journal.counts()
+    finally:
+        journal.close()
+
+    elapsed = time.perf_counter() - start_time
+    print(f"Журнал {args.journal} ({elapsed:.2f} с): "
+          f"запланировано {counts.get(JOURNAL_PLANNED, 0)}, применено {counts.get(JOURNAL_DONE, 0)}, "
+          f"конфликтов {counts.get(JOURNAL_CONFLICT, 0)}, откачено {counts.get(JOURNAL_ROLLED_BACK, 0)}")
+
+
+def benchmark_decoding(count: int = 10000, ascii_share: float = 0.8) -> Dict[str, float]:
+    """
+    Микробенчмарк декодирования тегов: прежнее поле-за-полем определение кодировки
+    против текущего parse_id3v1_tag.
+
+    Args:
+        count: Количество синтетических тегов
+        ascii_share: Доля тегов только из ASCII
+
+    Returns:
+        Словарь со временем обоих вариантов (в секундах на count тегов) и ускорением
+    """
+    rng = random.Random(0)
+    ascii_words = ['Queen', 'Bohemian Rhapsody', 'Metallica', 'Nothing Else Matters', 'Live', '1991']
+    cyrillic_words = ['Кино', 'Группа крови', 'Звезда по имени Солнце', 'Ария', 'Король и Шут', 'Лесник']
+
+    blocks = []
+    for _ in range(count):
+        words = ascii_words if rng.random() < ascii_share else cyrillic_words + ascii_words
+        block = bytearray(128)
+        block[0:3] = b'TAG'
+        for offset, length in ((3, 30), (33, 30), (63, 30), (97, 28)):
+            value = encode_string(rng.choice(words), length)
+            block[offset:offset + len(value)] = value
+        block[93:97] = str(rng.randint(1950, 2020)).encode('ascii')
+        block[126] = rng.randint(1, 20)
+        block[127] = 255
+        blocks.append(bytes(block))
+
+    def legacy_decode(field: bytes) -> str:
+        # Прежний путь: chardet для каждого непустого поля
+        clean = field.rstrip(b'\x00')
+        return clean.decode(detect_encoding(clean), errors='replace') if clean else ""
+
+    start = time.perf_counter()
+    for block in blocks:
+        for offset, end in ((3, 33), (33, 63), (63, 93), (93, 97), (97, 125)):
+            legacy_decode(block[offset:end])
+    legacy_time = time.perf_counter() - start
+
+    detect_tag_encoding.cache_clear()
+    start = time.perf_counter()
+    for block in blocks:
+        parse_id3v1_tag(block)
+    current_time = time.perf_counter() - start
+
+    return {
+        'legacy': legacy_time,
+        'current': current_time,
+        'speedup': legacy_time / current_time if current_time > 0 else float('inf')
+    }
+
+
+def generate_corpus(directory: str, count: int, seed: int = 0):
+    """
+    Создает синтетическую библиотеку mp3-файлов со случайными ID3v1-тегами.
+
+    Теги записываются в разных кодировках (windows-1251, koi8-r, latin1, ASCII);
+    часть файлов без тега, часть - без номера трека или жанра.
+
+    Args:
+        directory: Директория для файлов (создается при необходимости)
+        count: Количество файлов
+        seed: Начальное значение генератора случайных чисел
+    """
+    rng = random.Random(seed)
+    words = {
+        'windows-1251': ['Кино', 'Группа крови', 'Звезда по имени Солнце', 'Ария', 'Король и Шут', 'Лесник'],
+        'koi8-r': ['ДДТ', 'Что такое осень', 'Актриса весна', 'Последняя осень', 'Родина'],
+        'latin1': ['Björk', 'Jóga', 'Motörhead', 'Ace of Spades', 'Café del Mar', 'Sigur Rós'],
+        'ascii': ['Queen', 'Bohemian Rhapsody', 'Metallica', 'Nothing Else Matters', 'Nirvana', 'Lithium'],
+    }
+    encodings = list(words)
+    os.makedirs(directory, exist_ok=True)
+
+    for number in range(1, count + 1):
+        encoding = rng.choice(encodings)
+        pool = words[encoding] + words['ascii']
+        title = rng.choice(pool)
+
+        # Аудиоданные заменены случайными байтами, важен только размер и хвост файла
+        data = bytearray(rng.getrandbits(8) for _ in range(rng.randint(256, 2048)))
+        if rng.random() < 0.9:
+            tag_info = {
+                'title': title,
+                'artist': rng.choice(pool),
+                'album': rng.choice(pool),
+                'year': str(rng.randint(1960, 2020)),
+                'comment': rng.choice(pool),
+                'track': 0 if rng.random() < 0.3 else rng.randint(1, 20),
+                'genre': 255 if rng.random() < 0.3 else rng.randint(0, 125)
+            }
+            data += build_id3v1_tag(tag_info, 'latin1' if encoding == 'ascii' else encoding)
+
+        file_name = f"{number % 100:02d} - {number}.mp3"
+        with open(os.path.join(directory, file_name), 'wb') as f:
+            f.write(data)
+
+
+def run_benchmark(sizes: List[int], jobs_list: List[int], seed: int = 0) -> Dict:
+    """
+    Замеряет проходы чтения и обновления на синтетических библиотеках разного размера.
+
+    Для каждого размера и количества потоков создается свежая библиотека во временной
+    директории, затем выполняются проход чтения (пробный запуск) и проход обновления.
+
+    Args:
+        sizes: Размеры библиотек (количество файлов)
+        jobs_list: Количества потоков
+        seed: Начальное значение генератора корпуса
+
+    Returns:
+        Результаты в виде словаря для сохранения в JSON
+    """
+    results = []
+
+    for size in sizes:
+        for jobs in jobs_list:
+            with tempfile.TemporaryDirectory() as directory:
+                generate_corpus(directory, size, seed)
+                record = {'files': size, 'jobs': jobs}
+
+                for pass_name, extra_args in (('scan', ['--dry-run']), ('update', [])):
+                    args = build_parser().parse_args([directory, '--genre', '13', '--jobs', str(jobs)] + extra_args)
+                    detect_tag_encoding.cache_clear()
+
+                    start = time.perf_counter()
+                    for _ in run_ordered(lambda entry: process_file(entry.path, args),
+                                         iter_mp3_files(directory), jobs):
+                        pass
+                    elapsed = time.perf_counter() - start
+
+                    record[pass_name] = {
+                        'seconds': elapsed,
+                        'files_per_second': size / elapsed if elapsed > 0 else None
+                    }
+                    print(f"{pass_name:<7} файлов: {size:>7}, потоков: {jobs:>2}: {elapsed:.3f} с")
+
+                results.append(record)
+
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'chardet': chardet.__version__,
+        'decoding': benchmark_decoding(2000),
+        'runs': results
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Создает разбор аргументов командной строки"""
     parser = argparse.ArgumentParser(description='Обработка ID3v1-тегов в MP3 файлах')
-    parser.add_argument('directory', help='Директория с MP3 файлами')
+    parser.add_argument('directory', nargs='?', help='Директория с MP3 файлами')
     parser.add_argument('-d', '--dump', action='store_true', help='Вывести 16-ричный дамп тега')
-    parser.add_argument('-g', '--genre', type=int, default=255,
-                        help='Номер жанра для автоматической простановки (0-255, по умолчанию 255)')
+    parser.add_argument('-g', '--genre', type=parse_genre, default=255,
+                        help='Номер или название жанра для автоматической простановки (0-255, по умолчанию 255)')
+    parser.add_argument('--genre-rules', metavar='PATH',
+                        help='JSON файл с правилами жанров по исполнителям и шаблонам директорий')
     parser.add_argument('-e', '--encoding', default='windows-1251',
                         help='Кодировка для чтения/записи тегов (по умолчанию windows-1251)')
+    parser.add_argument('--id3v2', action='store_true',
+                        help='Читать также ID3v2-тег из начала файла и выводить объединенные данные')
+    parser.add_argument('-r', '--recursive', action='store_true',
+                        help='Обрабатывать также вложенные директории')
+    parser.add_argument('-i', '--index', nargs='?', const='', default=None, metavar='PATH',
+                        help=f'Использовать постоянный индекс тегов (по умолчанию {INDEX_FILENAME} в директории)')
+    parser.add_argument('-n', '--dry-run', action='store_true',
+                        help='Показать, какие теги будут изменены, ничего не записывая')
+    parser.add_argument('--async-io', action='store_true',
+                        help='Асинхронное чтение/запись тегов (для хранилищ с большой задержкой)')
+    parser.add_argument('--max-inflight', type=int, default=64,
+                        help='Максимальное число одновременных операций в режиме --async-io (по умолчанию 64)')
+    parser.add_argument('--journal', metavar='PATH',
+                        help='Пакетное обновление через журнал (повторный запуск продолжает прерванное)')
+    parser.add_argument('--rollback', action='store_true',
+                        help='Восстановить исходные теги по журналу --journal')
+    parser.add_argument('-w', '--where', action='append', metavar='FIELD=VALUE',
+                        help='Вывести файлы, теги которых удовлетворяют условию (можно указать несколько раз)')
+    parser.add_argument('--duplicates', nargs='?', const='-', metavar='PATH',
+                        help='Найти дубликаты треков и сохранить отчет в JSON (по умолчанию - в стандартный вывод)')
+    parser.add_argument('--fuzzy', type=float, nargs='?', const=0.85, metavar='RATIO',
+                        help='Нечеткий поиск дубликатов с порогом похожести (по умолчанию 0.85)')
+    parser.add_argument('-f', '--format', choices=OUTPUT_FORMATS, default='text',
+                        help='Формат вывода: text (по умолчанию), jsonl или csv')
+    parser.add_argument('--track-order', action='store_true',
+                        help='Если номер трека не найден в имени файла, брать его по порядку файла в директории')
+    parser.add_argument('--profile', action='store_true',
+                        help='Собрать время по этапам (обход, чтение, декодирование, кодирование, запись)')
+    parser.add_argument('--profile-output', metavar='PATH',
+                        help='Сохранить статистику cProfile (основной и рабочие потоки) в файл для pstats')
+    parser.add_argument('--watch', action='store_true',
+                        help='Следить за директорией и обрабатывать новые и измененные файлы')
+    parser.add_argument('--debounce', type=float, default=2.0, metavar='SEC',
+                        help='Время неизменности файла перед обработкой в режиме --watch (по умолчанию 2 с)')
+    parser.add_argument('--transcode', metavar='ENCODING',
+                        help='Перекодировать теги библиотеки в указанную кодировку (например windows-1251)')
+    parser.add_argument('--source-encoding', metavar='ENCODING',
+                        help='Исходная кодировка для --transcode (по умолчанию определяется по каждой директории)')
+    parser.add_argument('-s', '--summary', nargs='?', const='-', metavar='PATH',
+                        help='Собрать сводную статистику библиотеки и сохранить в JSON '
+                             '(по умолчанию - в стандартный вывод)')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Количество потоков для чтения/записи тегов (по умолчанию 1)')
+
+    parser.add_argument('--bench-decode', type=int, metavar='N',
+                        help='Запустить микробенчмарк декодирования на N синтетических тегах и выйти')
+    parser.add_argument('--benchmark', metavar='SIZES',
+                        help='Запустить набор бенчмарков на синтетических библиотеках указанных размеров '
+                             '(через запятую, например 100,1000) и выйти')
+    parser.add_argument('--benchmark-jobs', default='1,4', metavar='JOBS',
+                        help='Количества потоков для бенчмарка через запятую (по умолчанию 1,4)')
+    parser.add_argument('--benchmark-output', default='benchmark_results.json', metavar='PATH',
+                        help='Файл для результатов бенчмарка в JSON (по умолчанию benchmark_results.json)')
+
+    return parser
 
+
+def main():
+    parser = build_parser()
     args = parser.parse_args()
 
+    if args.bench_decode:
+        result = benchmark_decoding(args.bench_decode)
+        per_10k = 10000 / args.bench_decode
+        print(f"Поле-за-полем (chardet): {result['legacy'] * per_10k:.3f} с на 10k тегов")
+        print(f"Текущий декодер:         {result['current'] * per_10k:.3f} с на 10k тегов")
+        print(f"Ускорение: {result['speedup']:.1f}x")
+        return
+
+    if args.rollback and not args.journal:
+        parser.error('--rollback требует указания --journal')
+
+    if args.benchmark:
+        try:
+            sizes = [int(size) for size in args.benchmark.split(',')]
+            jobs_list = [int(jobs) for jobs in args.benchmark_jobs.split(',')]
+        except ValueError:
+            print("Ошибка: размеры и количества потоков бенчмарка должны быть числами через запятую")
+            return
+
+        results = run_benchmark(sizes, jobs_list)
+        with open(args.benchmark_output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Результаты бенчмарка сохранены в {args.benchmark_output}")
+        return
+
+    if args.directory is None and not args.journal:
+        parser.error('необходимо указать директорию с MP3 файлами')
+
     # Проверяем, что указанная директория существует
-    if not os.path.isdir(args.directory):
+    if args.directory is not None and not os.path.isdir(args.directory):
         print(f"Ошибка: директория {args.directory} не существует")
         return
 
@@ -259,55 +2575,155 @@ def main():
         print(f"Ошибка: номер жанра должен быть в диапазоне 0-255")
         return
 
-    # Проходим по всем файлам в директории
-    for filename in os.listdir(args.directory):
-        if filename.lower().endswith('.mp3'):
-            file_path = os.path.join(args.directory, filename)
+    genre_rules = None
+    if args.genre_rules:
+        try:
+            genre_rules = GenreRules.load(args.genre_rules, args.directory or '.')
+        except (OSError, ValueError, argparse.ArgumentTypeError) as e:
+            print(f"Ошибка при загрузке правил жанров {args.genre_rules}: {e}")
+            return
+
+    if args.jobs < 1:
+        print("Ошибка: количество потоков должно быть не меньше 1")
+        return
+
+    if args.max_inflight < 1:
+        print("Ошибка: число одновременных операций должно быть не меньше 1")
+        return
 
-            # Получаем теги
-            tag_info, tag_data = get_id3v1_tag(file_path)
+    if args.journal:
+        run_journaled(args, genre_rules)
+        return
 
-            if tag_info:
-                # Выводим информацию о файле
-                print(f"{tag_info['artist']} - {tag_info['title']} - {tag_info['album']}")
+    if args.transcode:
+        for encoding in filter(None, (args.transcode, args.source_encoding)):
+            try:
+                codecs.lookup(encoding)
+            except LookupError:
+                print(f"Ошибка: неизвестная кодировка {encoding}")
+                return
+
+        start_time = time.perf_counter()
+        counts = transcode_library(args)
+        elapsed = time.perf_counter() - start_time
+        rate = counts['files'] / elapsed if elapsed > 0 else 0.0
+        print(f"Директорий: {counts['directories']}, файлов с тегами: {counts['files']}, "
+              f"перекодировано: {counts['transcoded'] + counts['dry_run']}, без изменений: {counts['unchanged']}, "
+              f"ошибок: {counts['failed']} за {elapsed:.2f} с ({rate:.1f} файлов/с)")
+        return
 
-                # Если запрошен дамп, выводим его
-                if args.dump:
-                    print("Дамп ID3v1-тега:")
-                    print(hex_dump(tag_data))
-                    print()
+    if args.duplicates:
+        if args.fuzzy is not None and not 0 < args.fuzzy <= 1:
+            print("Ошибка: порог похожести должен быть в диапазоне (0, 1]")
+            return
 
-                # Проверяем, нужно ли проставить трек или жанр
-                needs_update = False
+        report = find_duplicates(args.directory, args.recursive, args.jobs, args.fuzzy)
+        if args.duplicates == '-':
+            print(json.dumps(report, ensure_ascii=False, indent=2))
+        else:
+            with open(args.duplicates, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"Найдено групп дубликатов: {report['duplicate_groups']}, отчет сохранен в {args.duplicates}")
+        return
 
-                if tag_info['track'] == 0:
-                    # В качестве примера, мы можем извлечь номер трека из имени файла, если оно начинается с цифр
-                    # Например, "01 - Название трека.mp3"
-                    try:
-                        track_num = int(filename.split()[0])
-                        tag_info['track'] = min(track_num, 255)  # Ограничиваем 255
-                        needs_update = True
-                        print(f"Проставлен номер трека: {tag_info['track']}")
-                    except (ValueError, IndexError):
-                        pass
+    if args.where:
+        conditions = {}
+        for condition in args.where:
+            field, _, value = condition.partition('=')
+            if field not in TagStore.TEXT_FIELDS + TagStore.BYTE_FIELDS:
+                print(f"Ошибка: неизвестное поле {field}")
+                return
+            if field in TagStore.BYTE_FIELDS and not value.isdigit():
+                print(f"Ошибка: значение поля {field} должно быть числом")
+                return
+            conditions[field] = value
+
+        store = TagStore.load(args.directory, args.recursive, args.jobs)
+        rows = store.filter(**conditions)
+        for row in rows:
+            print(store.path(row))
+        print(f"Найдено файлов: {len(rows)} из {len(store)}")
+        return
 
-                if tag_info['genre'] == 255:
-                    tag_info['genre'] = args.genre
-                    needs_update = True
-                    print(f"Проставлен жанр: {args.genre}")
+    # Открываем индекс тегов, если он запрошен
+    index = None
+    if args.index is not None:
+        index = TagIndex(args.index or os.path.join(args.directory, INDEX_FILENAME))
+
+    summary = LibrarySummary() if args.summary else None
+
+    if args.watch:
+        # Статистика в режиме слежения охватывает файлы, обработанные до остановки
+        writer = ResultWriter(sys.stdout, args.format, batch_size=1, summary=summary)
+        watcher = TagWatcher(args, writer, index, debounce=args.debounce, genre_rules=genre_rules)
+        try:
+            watcher.run()
+        finally:
+            writer.close()
+            if index is not None:
+                index.close()
+        print(f"Обработано файлов: {watcher.processed}", file=sys.stderr)
+        if summary is not None:
+            summary.save(args.summary, sys.stderr)
+        return
 
-                # Если нужно обновить теги, делаем это
-                if needs_update:
-                    if write_id3v1_tag(file_path, tag_info, args.encoding):
-                        print(f"Файл {filename} обновлен успешно")
-                    else:
-                        print(f"Не удалось обновить теги в файле {filename}")
+    # Профилировщик этапов; без --profile используется пустая заглушка
+    profiler = StageProfiler() if args.profile else NULL_PROFILER
+    cprofile = ThreadProfiles() if args.profile_output else None
 
-                print("---")
-            else:
-                print(f"Файл {filename} не содержит ID3v1-тегов")
-                print("---")
+    def handle(entry: os.DirEntry) -> Dict:
+        # stat берется из DirEntry (кэшируется) и нужен только индексу
+        file_stat = None
+        if index is not None:
+            try:
+                file_stat = entry.stat()
+            except OSError:
+                # Файл исчез после перечисления: process_file повторит stat и вернет read_error
+                pass
+        return process_file(entry.path, args, index, file_stat, genre_rules, profiler)
+
+    # При --jobs > 1 и --async-io файлы обрабатываются в рабочих потоках, их тоже нужно профилировать
+    if cprofile is not None:
+        handle = cprofile.wrap(handle)
+
+    # Перечисляем mp3-файлы лениво, обработка начинается с первого найденного файла
+    entries = profiler.iterate('listing', iter_mp3_files(args.directory, args.recursive))
+
+    # Обрабатываем файлы (при --jobs > 1 параллельно), вывод идет в исходном порядке
+    start_time = time.perf_counter()
+    processed = 0
+    writer = ResultWriter(sys.stdout, args.format, summary=summary)
+    if cprofile is not None:
+        cprofile.main.enable()
+    try:
+        if args.async_io:
+            processed = asyncio.run(print_results_async(handle, entries, args.max_inflight, writer))
+        else:
+            for result in run_ordered(handle, entries, args.jobs):
+                writer.write(result)
+                processed += 1
+    finally:
+        if cprofile is not None:
+            cprofile.main.disable()
+        writer.close()
+        if index is not None:
+            index.close()
+
+    # Итоговая статистика в машиночитаемых форматах уходит в stderr, чтобы не портить поток записей
+    elapsed = time.perf_counter() - start_time
+    rate = processed / elapsed if elapsed > 0 else 0.0
+    summary_stream = sys.stdout if args.format == 'text' else sys.stderr
+    print(f"Обработано файлов: {processed} за {elapsed:.2f} с ({rate:.1f} файлов/с)", file=summary_stream)
+    if index is not None:
+        print(f"Индекс: попаданий {index.hits}, промахов {index.misses}", file=summary_stream)
+    if summary is not None:
+        summary.save(args.summary, summary_stream)
+    if args.profile:
+        print(profiler.report(), file=summary_stream)
+    if cprofile is not None:
+        cprofile.dump_stats(args.profile_output)
+        print(f"Статистика cProfile сохранена в {args.profile_output}", file=summary_stream)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
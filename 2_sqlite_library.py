@@ -14,11 +14,843 @@ import xml.etree.ElementTree as ET
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import os
+import time
+import queue
+import argparse
+import threading
+import multiprocessing
+from pathlib import Path
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+
+
+# Профили настроек соединения: PRAGMA, применяемые сразу после подключения.
+# WAL позволяет читателям не блокироваться на пишущей транзакции, synchronous=NORMAL
+# в режиме WAL синхронизирует диск только на контрольных точках.
+PRAGMA_PROFILES = {
+    'default': {},
+    'performance': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,  # отрицательное значение - размер в КиБ (64 МиБ)
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    },
+}
+DEFAULT_PRAGMA_PROFILE = 'performance'
+
+# Числовые значения, которые SQLite возвращает при чтении PRAGMA, и их имена
+PRAGMA_VALUE_NAMES = {
+    'synchronous': {0: 'OFF', 1: 'NORMAL', 2: 'FULL', 3: 'EXTRA'},
+    'temp_store': {0: 'DEFAULT', 1: 'FILE', 2: 'MEMORY'},
+}
+REPORTED_PRAGMAS = ('journal_mode', 'synchronous', 'mmap_size', 'cache_size', 'temp_store', 'busy_timeout')
+
+# Версионированные миграции схемы: (версия, описание, SQL-операторы).
+# Текущая версия хранится в PRAGMA user_version, применяются только более новые шаги.
+SCHEMA_MIGRATIONS = [
+    (1, 'Базовые таблицы', [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            is_admin INTEGER DEFAULT 0
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS authors (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            country TEXT,
+            birth_year INTEGER,
+            death_year INTEGER
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS books (
+            id INTEGER PRIMARY KEY,
+            author_id INTEGER,
+            title TEXT NOT NULL,
+            pages INTEGER,
+            publisher TEXT,
+            publication_year INTEGER,
+            FOREIGN KEY (author_id) REFERENCES authors (id)
+        )
+        ''',
+    ]),
+    (2, 'Индексы для соединений, фильтров и экранов списков', [
+        'CREATE INDEX IF NOT EXISTS idx_books_author_id ON books (author_id)',
+        'CREATE INDEX IF NOT EXISTS idx_books_publication_year ON books (publication_year)',
+        'CREATE INDEX IF NOT EXISTS idx_authors_country ON authors (country)',
+        'CREATE INDEX IF NOT EXISTS idx_authors_years ON authors (birth_year, death_year)',
+        # Покрывающий индекс для списка авторов и комбобокса выбора автора:
+        # id входит в индекс как rowid, поэтому таблица authors не читается
+        'CREATE INDEX IF NOT EXISTS idx_authors_list ON authors (name, country, birth_year, death_year)',
+        'ANALYZE',
+    ]),
+]
+
+# Запросы экранов приложения (используются и экранами, и диагностикой планов)
+BOOKS_PAGE_QUERY = '''
+        SELECT books.id, books.title, authors.name, books.pages, books.publisher, books.publication_year
+        FROM books
+        LEFT JOIN authors ON books.author_id = authors.id
+        WHERE books.id > ? ORDER BY books.id LIMIT ?
+        '''
+BOOKS_PAGE_BEFORE_QUERY = '''
+        SELECT books.id, books.title, authors.name, books.pages, books.publisher, books.publication_year
+        FROM books
+        LEFT JOIN authors ON books.author_id = authors.id
+        WHERE books.id < ? ORDER BY books.id DESC LIMIT ?
+        '''
+AUTHORS_LIST_QUERY = 'SELECT id, name, country, birth_year, death_year FROM authors ORDER BY name'
+AUTHOR_CHOICES_QUERY = 'SELECT id, name FROM authors ORDER BY name'
+AUTHOR_BY_ID_QUERY = 'SELECT name, country, birth_year, death_year FROM authors WHERE id = ?'
+AUTHENTICATE_QUERY = 'SELECT id, is_admin FROM users WHERE username = ? AND password = ?'
+
+# Экран -> (запрос, пример параметров для EXPLAIN QUERY PLAN)
+SCREEN_QUERIES = {
+    'Авторизация': (AUTHENTICATE_QUERY, ('admin', '')),
+    'Список книг (вперед)': (BOOKS_PAGE_QUERY, (0, 200)),
+    'Список книг (назад)': (BOOKS_PAGE_BEFORE_QUERY, (1000, 200)),
+    'Список авторов': (AUTHORS_LIST_QUERY, ()),
+    'Добавление книги (выбор автора)': (AUTHOR_CHOICES_QUERY, ()),
+    'Экспорт автора': (AUTHOR_BY_ID_QUERY, (1,)),
+}
+
+
+def normalize_pragma_value(name, value):
+    """Приведение значения PRAGMA к виду, в котором его возвращает read_pragma (1 -> NORMAL и т.п.)"""
+    if isinstance(value, str):
+        value = value.strip().upper()
+        if value.lstrip('-').isdigit():
+            value = int(value)
+    value = PRAGMA_VALUE_NAMES.get(name, {}).get(value, value)
+    return value
+
+
+def read_pragma(conn, name):
+    """Чтение текущего значения PRAGMA с расшифровкой числовых кодов"""
+    row = conn.execute(f'PRAGMA {name}').fetchone()
+    if row is None:
+        # Неизвестные PRAGMA SQLite игнорирует и ничего не возвращает
+        return None
+    value = row[0]
+    value = PRAGMA_VALUE_NAMES.get(name, {}).get(value, value)
+    return value.upper() if isinstance(value, str) else value
+
+
+def connect_database(db_path, profile=DEFAULT_PRAGMA_PROFILE, overrides=None):
+    """
+    Подключение к БД с применением профиля настроек.
+
+    Args:
+        db_path: Путь к файлу БД
+        profile: Имя профиля из PRAGMA_PROFILES
+        overrides: Словарь PRAGMA, переопределяющих значения профиля
+
+    Returns:
+        Кортеж (соединение, словарь запрошенных PRAGMA)
+    """
+    pragmas = dict(PRAGMA_PROFILES[profile])
+    pragmas.update(overrides or {})
+
+    conn = sqlite3.connect(db_path)
+    for name, value in pragmas.items():
+        conn.execute(f'PRAGMA {name} = {value}')
+
+    return conn, pragmas
+
+
+def check_database_settings(conn, pragmas):
+    """
+    Проверка действующих настроек соединения.
+
+    SQLite молча игнорирует часть PRAGMA (например, WAL недоступен для БД в памяти,
+    а mmap_size ограничен сборкой), поэтому значения перечитываются после подключения.
+
+    Args:
+        conn: Соединение с БД
+        pragmas: Словарь запрошенных PRAGMA
+
+    Returns:
+        Список кортежей (имя, действующее значение, запрошенное значение или None, совпадает ли)
+    """
+    report = []
+
+    for name in dict.fromkeys((*REPORTED_PRAGMAS, *pragmas)):
+        actual = read_pragma(conn, name)
+        requested = pragmas.get(name)
+        if requested is not None:
+            requested = normalize_pragma_value(name, requested)
+        report.append((name, actual, requested, requested is None or str(actual) == str(requested)))
+
+    return report
+
+
+def print_database_settings(report):
+    """Вывод отчета о действующих настройках соединения"""
+    print("Настройки соединения с БД:")
+    for name, actual, requested, matches in report:
+        note = '' if matches else f'  <-- запрошено {requested}'
+        print(f"  {name} = {actual}{note}")
+
+
+def parse_pragma_override(text):
+    """Разбор аргумента вида имя=значение для --pragma"""
+    name, sep, value = text.partition('=')
+    if not sep or not name.strip().isidentifier() or not value.strip():
+        raise argparse.ArgumentTypeError(f"ожидается имя=значение, получено {text!r}")
+    value = value.strip()
+    return name.strip(), int(value) if value.lstrip('-').isdigit() else value
+
+
+def migrate_database(conn):
+    """
+    Применение к БД миграций схемы, которые новее ее текущей версии.
+
+    Args:
+        conn: Соединение с БД
+
+    Returns:
+        Версия схемы после миграции
+    """
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+
+    for target, description, statements in SCHEMA_MIGRATIONS:
+        if target <= version:
+            continue
+        # Каждый шаг выполняется в отдельной транзакции вместе с записью версии.
+        # sqlite3 сам открывает транзакцию только перед INSERT/UPDATE/DELETE,
+        # поэтому для DDL и PRAGMA она начинается явно
+        conn.execute('BEGIN')
+        try:
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {int(target)}')
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        version = target
+
+    return version
+
+
+def explain_screen_queries(conn):
+    """
+    Вывод EXPLAIN QUERY PLAN для запроса каждого экрана.
+
+    Шаги плана с полным просмотром таблицы (SCAN без индекса) помечаются предупреждением.
+
+    Args:
+        conn: Соединение с БД
 
-class LibrarySystem:
-    def __init__(self):
+    Returns:
+        Количество шагов плана с полным просмотром таблицы
+    """
+    scans = 0
+
+    for screen, (query, params) in SCREEN_QUERIES.items():
+        print(f"{screen}:")
+        print(f"  {' '.join(query.split())}")
+
+        for _, _, _, detail in conn.execute('EXPLAIN QUERY PLAN ' + query, params):
+            full_scan = detail.startswith('SCAN') and 'INDEX' not in detail
+            print(f"    {detail}{'  <-- полный просмотр таблицы' if full_scan else ''}")
+            scans += full_scan
+
+        print()
+
+    return scans
+
+
+def author_from_json(data):
+    """
+    Преобразование JSON-объекта автора в запись для БД.
+
+    Args:
+        data: Словарь вида {"name", "country", "years": [рождение, смерть], "books": [...]}
+
+    Returns:
+        Словарь с полями автора и списком его книг
+    """
+    author_data = {
+        'name': data.get('name'),
+        'country': data.get('country'),
+        'birth_year': None,
+        'death_year': None,
+        'books': []
+    }
+
+    # Обработка годов жизни
+    years = data.get('years', [])
+    if len(years) >= 2:
+        author_data['birth_year'] = years[0]
+        author_data['death_year'] = years[1]
+
+    # Необязательный список книг автора
+    for book in data.get('books', []):
+        author_data['books'].append((book.get('title'), book.get('pages'), book.get('publisher'), book.get('year')))
+
+    return author_data
+
+
+def parse_int_attr(elem, name):
+    """Чтение целочисленного атрибута XML-элемента (None, если атрибута нет или он не число)"""
+    try:
+        return int(elem.attrib[name])
+    except (KeyError, ValueError):
+        return None
+
+
+def author_from_xml(root):
+    """
+    Преобразование XML-элемента <author> в запись для БД.
+
+    Args:
+        root: Элемент вида <author><name/><country/><years born="" died=""/><books><book .../></books></author>
+
+    Returns:
+        Словарь с полями автора и списком его книг
+    """
+    author_data = {
+        'name': None,
+        'country': None,
+        'birth_year': None,
+        'death_year': None,
+        'books': []
+    }
+
+    # Получение имени автора
+    name_elem = root.find('name')
+    if name_elem is not None and name_elem.text:
+        author_data['name'] = name_elem.text
+
+    # Получение страны автора
+    country_elem = root.find('country')
+    if country_elem is not None and country_elem.text:
+        author_data['country'] = country_elem.text
+
+    # Получение годов жизни
+    years_elem = root.find('years')
+    if years_elem is not None:
+        author_data['birth_year'] = parse_int_attr(years_elem, 'born')
+        author_data['death_year'] = parse_int_attr(years_elem, 'died')
+
+    # Необязательный список книг автора
+    for book in root.iterfind('books/book'):
+        author_data['books'].append((book.get('title'), parse_int_attr(book, 'pages'),
+                                     book.get('publisher'), parse_int_attr(book, 'year')))
+
+    return author_data
+
+
+def parse_author_file(file_path):
+    """
+    Парсинг файла автора JSON или XML (выполняется в процессах пула).
+
+    Args:
+        file_path: Путь к файлу
+
+    Returns:
+        Кортеж (путь, запись автора или None, текст ошибки или None)
+    """
+    try:
+        if file_path.lower().endswith('.xml'):
+            return file_path, author_from_xml(ET.parse(file_path).getroot()), None
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return file_path, author_from_json(json.load(f)), None
+    except Exception as e:
+        return file_path, None, str(e)
+
+
+def parse_author_line(item):
+    """
+    Парсинг строки JSONL-дампа (выполняется в процессах пула).
+
+    Args:
+        item: Кортеж (метка источника, строка JSON)
+
+    Returns:
+        Кортеж (метка, запись автора или None, текст ошибки или None)
+    """
+    label, line = item
+    try:
+        return label, author_from_json(json.loads(line)), None
+    except Exception as e:
+        return label, None, str(e)
+
+
+def validate_author_record(record):
+    """
+    Проверка записи автора перед вставкой (ограничения NOT NULL и типы числовых полей).
+
+    Args:
+        record: Запись автора с книгами
+
+    Returns:
+        Текст ошибки или None, если запись корректна
+    """
+    if not isinstance(record['name'], str) or not record['name'].strip():
+        return "не указано имя автора"
+
+    for number, (title, pages, publisher, year) in enumerate(record['books'], 1):
+        if not isinstance(title, str) or not title.strip():
+            return f"у книги №{number} не указано название"
+        for field, value in (('количество страниц', pages), ('год издания', year)):
+            if value is not None and (not isinstance(value, int) or isinstance(value, bool)):
+                return f"у книги «{title}» поле «{field}» должно быть целым числом"
+
+    return None
+
+
+def iter_author_files(directory):
+    """Потоковый рекурсивный обход каталога с файлами авторов *.json и *.xml"""
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from iter_author_files(entry.path)
+            elif entry.name.lower().endswith(('.json', '.xml')):
+                yield entry.path
+
+
+def iter_jsonl_lines(file_path):
+    """Потоковое чтение непустых строк JSONL-дампа с метками 'файл:строка'"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            if line.strip():
+                yield f"{file_path}:{number}", line
+
+
+def iter_xml_dump(file_path):
+    """
+    Потоковый разбор XML-дампа вида <authors><author>...</author>...</authors>.
+
+    Элементы разбираются по мере чтения и сразу освобождаются, поэтому дамп не загружается в память целиком.
+    """
+    for number, (_, elem) in enumerate(ET.iterparse(file_path), 1):
+        if elem.tag != 'author':
+            continue
+        try:
+            yield f"{file_path}:author[{number}]", author_from_xml(elem), None
+        except Exception as e:
+            yield f"{file_path}:author[{number}]", None, str(e)
+        elem.clear()
+
+
+def iter_batches(items, size):
+    """Разбиение итератора на списки по size элементов"""
+    items = iter(items)
+    while True:
+        batch = list(islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+
+def insert_author_batch(conn, records):
+    """
+    Вставка пачки авторов и их книг в одной транзакции через executemany.
+
+    Идентификаторы авторов назначаются заранее (MAX(id) + 1, ...), чтобы книги можно было
+    вставить той же пачкой, не запрашивая lastrowid для каждой строки.
+
+    Args:
+        conn: Соединение с БД
+        records: Список записей авторов
+
+    Returns:
+        Кортеж (количество авторов, количество книг)
+    """
+    authors = []
+    books = []
+
+    with conn:
+        next_id = conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM authors').fetchone()[0]
+        for author_id, record in enumerate(records, next_id):
+            authors.append((author_id, record['name'], record['country'], record['birth_year'], record['death_year']))
+            books.extend((author_id, *book) for book in record['books'])
+
+        conn.executemany("INSERT INTO authors (id, name, country, birth_year, death_year) VALUES (?, ?, ?, ?, ?)",
+                         authors)
+        conn.executemany(
+            "INSERT INTO books (author_id, title, pages, publisher, publication_year) VALUES (?, ?, ?, ?, ?)",
+            books)
+
+    return len(authors), len(books)
+
+
+def bulk_import(conn, source, batch_size=5000, workers=None, log=print):
+    """
+    Массовый импорт авторов и книг из каталога файлов JSON/XML, JSONL-дампа, XML-дампа
+    или одного файла автора *.json.
+
+    Файлы каталога и строки JSONL разбираются в пуле процессов; пока пул разбирает следующую
+    пачку, предыдущая вставляется в БД одной транзакцией.
+
+    Args:
+        conn: Соединение с БД
+        source: Каталог, файл *.jsonl, файл *.json с одним автором или файл *.xml
+            (дамп <authors> или один <author>)
+        batch_size: Количество авторов в одной транзакции
+        workers: Количество процессов пула (None - по числу ядер)
+        log: Функция вывода сообщений об ошибках и итогов
+
+    Returns:
+        Словарь со статистикой: authors, books, errors, seconds, rows_per_second
+
+    Raises:
+        ValueError: Если формат файла не поддерживается или параметры пачек некорректны
+    """
+    if batch_size < 1:
+        raise ValueError("размер пачки должен быть не меньше 1")
+    if workers is not None and workers < 1:
+        raise ValueError("количество процессов должно быть не меньше 1")
+
+    extension = os.path.splitext(source)[1].lower()
+    if not os.path.isdir(source) and extension not in ('.json', '.jsonl', '.xml'):
+        raise ValueError(f"неподдерживаемый формат файла {source} (ожидается каталог, .json, .jsonl или .xml)")
+
+    stats = {'authors': 0, 'books': 0, 'errors': 0}
+    started = time.perf_counter()
+
+    def insert_results(results):
+        records = []
+        labels = []
+        for label, record, error in results:
+            if error is None:
+                error = validate_author_record(record)
+            if error is not None:
+                stats['errors'] += 1
+                log(f"Ошибка разбора {label}: {error}")
+            else:
+                records.append(record)
+                labels.append(label)
+        if not records:
+            return
+
+        try:
+            authors, books = insert_author_batch(conn, records)
+        except sqlite3.IntegrityError:
+            # Пачка откатилась целиком - вставляем записи по одной, чтобы отсеять только ошибочные
+            authors = books = 0
+            for label, record in zip(labels, records):
+                try:
+                    inserted = insert_author_batch(conn, [record])
+                except sqlite3.IntegrityError as e:
+                    stats['errors'] += 1
+                    log(f"Ошибка вставки {label}: {e}")
+                    continue
+                authors += inserted[0]
+                books += inserted[1]
+        stats['authors'] += authors
+        stats['books'] += books
+
+    if not os.path.isdir(source) and extension == '.xml':
+        # XML разбирается потоково в основном процессе; файл с одним <author> - частный случай дампа
+        for batch in iter_batches(iter_xml_dump(source), batch_size):
+            insert_results(batch)
+    elif not os.path.isdir(source) and extension == '.json':
+        # Один файл автора (как АСП.json) - пул процессов не нужен
+        insert_results([parse_author_file(source)])
+    else:
+        if os.path.isdir(source):
+            items, parse = iter_author_files(source), parse_author_file
+        else:
+            items, parse = iter_jsonl_lines(source), parse_author_line
+
+        # Процессы запускаются через spawn: импорт из интерфейса идет в потоке БД, а fork
+        # многопоточного процесса (Tk, поток БД) может унаследовать захваченные блокировки
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            pending = None
+            for batch in iter_batches(items, batch_size):
+                # Разбор следующей пачки запускается до вставки предыдущей
+                results = pool.map(parse, batch, chunksize=max(1, batch_size // 64))
+                if pending is not None:
+                    insert_results(pending)
+                pending = results
+            if pending is not None:
+                insert_results(pending)
+
+    stats['seconds'] = time.perf_counter() - started
+    rows = stats['authors'] + stats['books']
+    stats['rows_per_second'] = rows / stats['seconds'] if stats['seconds'] > 0 else 0.0
+
+    log(f"Импортировано авторов: {stats['authors']}, книг: {stats['books']}, ошибок: {stats['errors']} "
+        f"за {stats['seconds']:.2f} с ({stats['rows_per_second']:.0f} строк/с)")
+
+    return stats
+
+
+class QueryExecutor:
+    """
+    Выполнение запросов к БД в отдельном потоке со своим соединением.
+
+    Задачи выполняются по очереди в потоке БД, а результаты передаются обратно в поток Tk:
+    очередь результатов опрашивается через root.after, поэтому обработчики результатов
+    могут свободно работать с виджетами. При переходе на другой экран вызывается
+    cancel_pending: еще не начатые чтения пропускаются, выполняющееся прерывается через
+    interrupt, а их результаты отбрасываются. Запросы на запись не отменяются.
+    """
+
+    def __init__(self, root, db_path, profile=DEFAULT_PRAGMA_PROFILE, pragma_overrides=None, poll_interval=20):
+        """
+        Args:
+            root: Главное окно Tk
+            db_path: Путь к файлу БД
+            profile: Имя профиля настроек соединения
+            pragma_overrides: Словарь PRAGMA, переопределяющих значения профиля
+            poll_interval: Интервал опроса очереди результатов, мс
+        """
+        self.root = root
+        self.poll_interval = poll_interval
+        self.tasks = queue.Queue()
+        self.results = queue.Queue()
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.running_generation = None
+        self.pending = 0
+        self.polling = False
         self.conn = None
-        self.cursor = None
+
+        self.thread = threading.Thread(target=self.worker, args=(db_path, profile, pragma_overrides), daemon=True)
+        self.thread.start()
+
+    def worker(self, db_path, profile, pragma_overrides):
+        """Цикл потока БД: выполнение задач и передача результатов в очередь"""
+        try:
+            self.conn, _ = connect_database(db_path, profile, pragma_overrides)
+            connect_error = None
+        except Exception as e:
+            connect_error = e
+
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                break
+            generation, func, on_done, on_error = task
+
+            if connect_error is not None:
+                # Без соединения каждая задача завершается ошибкой подключения
+                self.results.put((generation, None, connect_error, on_done, on_error))
+                continue
+
+            with self.lock:
+                if generation is not None and generation < self.generation:
+                    # Экран, запросивший данные, уже закрыт
+                    self.results.put((generation, None, None, None, None))
+                    continue
+                self.running_generation = generation
+
+            try:
+                result, error = func(self.conn), None
+            except Exception as e:
+                result, error = None, e
+
+            with self.lock:
+                self.running_generation = None
+            self.results.put((generation, result, error, on_done, on_error))
+
+        if self.conn is not None:
+            self.conn.close()
+
+    def submit(self, func, on_done=None, on_error=None, cancellable=True):
+        """
+        Постановка задачи в очередь потока БД (вызывается из потока Tk).
+
+        Args:
+            func: Функция func(conn), выполняемая в потоке БД
+            on_done: Обработчик результата on_done(result), вызывается в потоке Tk
+            on_error: Обработчик исключения on_error(error), по умолчанию - окно с ошибкой
+            cancellable: Отменять ли задачу при переходе на другой экран
+        """
+        generation = self.generation if cancellable else None
+        self.tasks.put((generation, func, on_done, on_error))
+        self.pending += 1
+
+        if not self.polling:
+            self.polling = True
+            self.root.after(self.poll_interval, self.poll)
+
+    def fetch_all(self, query, params=(), on_done=None, on_error=None):
+        """Чтение всех строк запроса в потоке БД"""
+        self.submit(lambda conn: conn.execute(query, params).fetchall(), on_done, on_error)
+
+    def fetch_one(self, query, params=(), on_done=None, on_error=None):
+        """Чтение одной строки запроса в потоке БД"""
+        self.submit(lambda conn: conn.execute(query, params).fetchone(), on_done, on_error)
+
+    def execute(self, query, params=(), on_done=None, on_error=None):
+        """Выполнение запроса на запись в отдельной транзакции (результат - lastrowid)"""
+        def run(conn):
+            with conn:
+                return conn.execute(query, params).lastrowid
+
+        self.submit(run, on_done, on_error, cancellable=False)
+
+    def poll(self):
+        """Передача готовых результатов обработчикам (в потоке Tk)"""
+        while True:
+            try:
+                generation, result, error, on_done, on_error = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.pending -= 1
+
+            if generation is not None and generation < self.generation:
+                continue
+            if error is not None:
+                if on_error:
+                    on_error(error)
+                else:
+                    messagebox.showerror("Ошибка", f"Ошибка запроса к БД: {str(error)}")
+            elif on_done:
+                on_done(result)
+
+        if self.pending:
+            self.root.after(self.poll_interval, self.poll)
+        else:
+            self.polling = False
+
+    def cancel_pending(self):
+        """Отмена чтений, запрошенных предыдущим экраном"""
+        with self.lock:
+            self.generation += 1
+            if self.running_generation is not None and self.conn is not None:
+                self.conn.interrupt()
+
+    def close(self):
+        """Остановка потока БД и закрытие его соединения"""
+        self.cancel_pending()
+        self.tasks.put(None)
+        self.thread.join(timeout=5)
+
+
+class PagedTreeview:
+    """
+    Виртуализированная загрузка строк в ttk.Treeview.
+
+    Строки запрашиваются страницами по ключу (keyset: id > последнего загруженного),
+    без OFFSET и без чтения всей таблицы. В дереве одновременно держится не больше
+    max_pages страниц: при прокрутке вниз догружается следующая страница и удаляется
+    верхняя, при прокрутке вверх - наоборот. Поэтому память и время первой
+    отрисовки не зависят от размера таблицы.
+    """
+
+    def __init__(self, tree, scrollbar, fetch_page, page_size=200, max_pages=3):
+        """
+        Args:
+            tree: Таблица ttk.Treeview (первый столбец строк - id)
+            scrollbar: Вертикальный скроллбар таблицы
+            fetch_page: Функция fetch_page(after_id, before_id, limit, callback), передающая в callback строки по возрастанию id
+            page_size: Количество строк на странице
+            max_pages: Максимальное количество страниц в дереве
+        """
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.fetch_page = fetch_page
+        self.page_size = page_size
+        self.max_rows = page_size * max_pages
+        self.loading = False
+        self.at_start = True
+        self.at_end = False
+
+        self.tree.configure(yscrollcommand=self.on_scroll)
+
+    def load_first_page(self):
+        """Загружает первую страницу"""
+        self.loading = True
+        self.fetch_page(None, None, self.page_size, self.show_first_page)
+
+    def show_first_page(self, rows):
+        """Отображает первую загруженную страницу"""
+        self.append_rows(rows)
+        self.at_end = len(rows) < self.page_size
+        self.loading = False
+
+    def append_rows(self, rows):
+        for row in rows:
+            self.tree.insert('', tk.END, iid=str(row[0]), values=row)
+
+    def on_scroll(self, first, last):
+        """Обработчик прокрутки: обновляет скроллбар и при приближении к краю догружает страницу"""
+        self.scrollbar.set(first, last)
+        if self.loading:
+            return
+
+        # Загрузка откладывается до простоя, чтобы не вставлять строки внутри обработчика прокрутки
+        if float(last) > 0.9 and not self.at_end:
+            self.loading = True
+            self.tree.after_idle(self.load_next)
+        elif float(first) < 0.1 and not self.at_start:
+            self.loading = True
+            self.tree.after_idle(self.load_previous)
+
+    def load_next(self):
+        """Запрашивает страницу после последней строки"""
+        children = self.tree.get_children()
+        last_id = int(children[-1]) if children else None
+        self.fetch_page(last_id, None, self.page_size, self.show_next)
+
+    def show_next(self, rows):
+        """Добавляет загруженную страницу в конец и отбрасывает лишние строки сверху"""
+        try:
+            self.at_end = len(rows) < self.page_size
+            if not rows:
+                return
+
+            children = self.tree.get_children()
+            anchor = children[-1] if children else None
+            self.append_rows(rows)
+
+            children = self.tree.get_children()
+            excess = len(children) - self.max_rows
+            if excess > 0:
+                self.tree.delete(*children[:excess])
+                self.at_start = False
+            if anchor:
+                self.tree.see(anchor)
+        finally:
+            self.loading = False
+
+    def load_previous(self):
+        """Запрашивает страницу перед первой строкой"""
+        children = self.tree.get_children()
+        if not children:
+            self.loading = False
+            return
+        self.fetch_page(None, int(children[0]), self.page_size, self.show_previous)
+
+    def show_previous(self, rows):
+        """Добавляет загруженную страницу в начало и отбрасывает лишние строки снизу"""
+        try:
+            self.at_start = len(rows) < self.page_size
+            if not rows:
+                return
+
+            anchor = self.tree.get_children()[0]
+            for row in reversed(rows):
+                self.tree.insert('', 0, iid=str(row[0]), values=row)
+
+            children = self.tree.get_children()
+            excess = len(children) - self.max_rows
+            if excess > 0:
+                self.tree.delete(*children[-excess:])
+                self.at_end = False
+            self.tree.see(anchor)
+        finally:
+            self.loading = False
+
+
+class LibrarySystem:
+    def __init__(self, db_path='library.db', profile=DEFAULT_PRAGMA_PROFILE, pragma_overrides=None):
+        self.db_path = db_path
+        self.profile = profile
+        self.pragma_overrides = pragma_overrides
+        self.executor = None
         self.current_user = None
 
         # Инициализация БД
@@ -29,67 +861,40 @@ class LibrarySystem:
         self.root.title('Библиотечная информационная система (SQLite)')
         self.root.geometry('800x600')
 
+        # Все запросы экранов выполняются в отдельном потоке БД
+        self.executor = QueryExecutor(self.root, self.db_path, self.profile, self.pragma_overrides)
+
         # Открытие окна авторизации
         self.show_login_screen()
 
     def initialize_database(self):
-        """Инициализация БД и создание сущностей"""
-        self.conn = sqlite3.connect('library.db')
-        self.cursor = self.conn.cursor()
+        """Инициализация БД и создание сущностей (до запуска интерфейса, в основном потоке)"""
+        conn, pragmas = connect_database(self.db_path, self.profile, self.pragma_overrides)
+        cursor = conn.cursor()
 
-        # Создание таблицы пользователей
-        self.cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            is_admin INTEGER DEFAULT 0
-        )
-        ''')
-
-        # Создание таблицы авторов
-        self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS authors (
-                    id INTEGER PRIMARY KEY,
-                    name TEXT NOT NULL,
-                    country TEXT,
-                    birth_year INTEGER,
-                    death_year INTEGER
-                )
-                ''')
-
-        # Создание таблицы книг
-        self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS books (
-                    id INTEGER PRIMARY KEY,
-                    author_id INTEGER,
-                    title TEXT NOT NULL,
-                    pages INTEGER,
-                    publisher TEXT,
-                    publication_year INTEGER,
-                    FOREIGN KEY (author_id) REFERENCES authors (id)
-                )
-                ''')
-
-        # Добавление тестового администратора, если таблица пользователей пуста
-        self.cursor.execute("SELECT COUNT(*) FROM users")
-        if self.cursor.fetchone()[0] == 0:
-            admin_password = self.hash_password("admin")
-            self.cursor.execute("INSERT INTO users (username, password, is_admin) VALUES (?, ?, ?)", ("admin", admin_password, 1))
-
-        self.conn.commit()
+        try:
+            # Самопроверка: вывод действующих настроек соединения
+            print_database_settings(check_database_settings(conn, pragmas))
+
+            # Создание таблиц и индексов
+            migrate_database(conn)
+
+            # Добавление тестового администратора, если таблица пользователей пуста
+            cursor.execute("SELECT COUNT(*) FROM users")
+            if cursor.fetchone()[0] == 0:
+                admin_password = self.hash_password("admin")
+                cursor.execute("INSERT INTO users (username, password, is_admin) VALUES (?, ?, ?)", ("admin", admin_password, 1))
+
+            conn.commit()
+        finally:
+            conn.close()
 
     def hash_password(self, password):
         """Хэширование пароля с использованием SHA-256"""
         return hashlib.sha256(password.encode()).hexdigest()
 
-    def authenticate(self, username, password):
-        """Проверка учётных данных пользователя"""
-        hashed_password = self.hash_password(password)
-        self.cursor.execute("SELECT id, is_admin FROM users WHERE username = ? AND password = ?",
-                            (username, hashed_password))
-        user = self.cursor.fetchone()
-
+    def authenticate(self, username, user):
+        """Проверка учётных данных пользователя по результату запроса"""
         if user:
             self.current_user = {"id:": user[0], "username": username, "is_admin": user[1]}
             return True
@@ -97,7 +902,8 @@ class LibrarySystem:
 
     def show_login_screen(self):
         """Отображение экрана авторизации"""
-        # Очистка текущего окна
+        # Отмена запросов предыдущего экрана и очистка текущего окна
+        self.executor.cancel_pending()
         for widget in self.root.winfo_children():
             widget.destroy()
 
@@ -130,7 +936,8 @@ class LibrarySystem:
 
     def show_registration_screen(self):
         """Отображение экрана регистрации"""
-        # Очистка текущего окна
+        # Отмена запросов предыдущего экрана и очистка текущего окна
+        self.executor.cancel_pending()
         for widget in self.root.winfo_children():
             widget.destroy()
 
@@ -174,15 +981,19 @@ class LibrarySystem:
             messagebox.showerror("Ошибка", "Пароли не совпадают")
             return
 
-        try:
-            hashed_password = self.hash_password(password)
-            self.cursor.execute("INSERT INTO users (username, password) VALUES (?, ?)",
-                                (username, hashed_password))
-            self.conn.commit()
+        def registered(_):
             messagebox.showinfo("Успех", "Пользователь успешно зарегистрирован")
             self.show_login_screen()
-        except sqlite3.IntegrityError:
-            messagebox.showerror("Ошибка", "Пользователь с таким именем уже существует")
+
+        def failed(error):
+            if isinstance(error, sqlite3.IntegrityError):
+                messagebox.showerror("Ошибка", "Пользователь с таким именем уже существует")
+            else:
+                messagebox.showerror("Ошибка", f"Не удалось зарегистрировать пользователя: {str(error)}")
+
+        hashed_password = self.hash_password(password)
+        self.executor.execute("INSERT INTO users (username, password) VALUES (?, ?)",
+                              (username, hashed_password), on_done=registered, on_error=failed)
 
     def login(self, username, password):
         """Обработка входа пользователя"""
@@ -190,7 +1001,12 @@ class LibrarySystem:
             messagebox.showerror("Ошибка", "Введите имя пользователя и пароль")
             return
 
-        if self.authenticate(username, password):
+        self.executor.fetch_one(AUTHENTICATE_QUERY, (username, self.hash_password(password)),
+                                on_done=lambda user: self.finish_login(username, user))
+
+    def finish_login(self, username, user):
+        """Завершение входа после проверки учётных данных в потоке БД"""
+        if self.authenticate(username, user):
             messagebox.showinfo("Успех", f"Добро пожаловать, {username}!")
             self.show_main_menu()
         else:
@@ -198,7 +1014,8 @@ class LibrarySystem:
 
     def show_main_menu(self):
         """Отображение главного меню программы"""
-        # Очистка текущего окна
+        # Отмена запросов предыдущего экрана и очистка текущего окна
+        self.executor.cancel_pending()
         for widget in self.root.winfo_children():
             widget.destroy()
 
@@ -217,6 +1034,7 @@ class LibrarySystem:
         author_menu.add_command(label="Список авторов", command=self.show_authors)
         author_menu.add_command(label="Добавить автора", command=self.show_add_author)
         author_menu.add_command(label="Импорт автора из файла", command=self.show_import_author)
+        author_menu.add_command(label="Массовый импорт из папки", command=self.bulk_import_directory)
         menubar.add_cascade(label="Авторы", menu=author_menu)
 
         # Меню учетной записи
@@ -272,26 +1090,39 @@ class LibrarySystem:
 
         # Добавление скроллбара
         scrollbar = ttk.Scrollbar(books_frame, orient=tk.VERTICAL, command=tree.yview)
-        tree.configure(yscroll=scrollbar.set)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         tree.pack(fill=tk.BOTH, expand=True)
 
-        # Получение данных из БД
-        self.cursor.execute('''
-        SELECT books.id, books.title, authors.name, books.pages, books.publisher, books.publication_year
-        FROM books
-        LEFT JOIN authors ON books.author_id = authors.id
-        ''')
-
-        books = self.cursor.fetchall()
-
-        # Заполнение таблицы данными
-        for book in books:
-            tree.insert('', tk.END, values=book)
+        # Книги загружаются постранично по мере прокрутки
+        pager = PagedTreeview(tree, scrollbar, self.fetch_books_page)
+        pager.load_first_page()
 
         # Добавление кнопки возврата
         ttk.Button(books_frame, text="Назад", command=self.show_main_menu).pack(pady=10)
 
+    def fetch_books_page(self, after_id, before_id, limit, callback):
+        """
+        Получение страницы книг по ключу books.id (keyset-пагинация) в потоке БД.
+
+        Args:
+            after_id: Вернуть книги с id больше указанного
+            before_id: Вернуть книги с id меньше указанного
+            limit: Количество строк
+            callback: Обработчик списка строк (id, название, автор, страниц, издательство, год) по возрастанию id
+        """
+        def failed(error):
+            messagebox.showerror("Ошибка", f"Не удалось загрузить список книг: {str(error)}")
+            # Пустая страница останавливает дальнейшую подгрузку
+            callback([])
+
+        if before_id is not None:
+            # Страница перед before_id: берем ближайшие строки по убыванию и разворачиваем
+            self.executor.fetch_all(BOOKS_PAGE_BEFORE_QUERY, (before_id, limit),
+                                    on_done=lambda rows: callback(rows[::-1]), on_error=failed)
+        else:
+            self.executor.fetch_all(BOOKS_PAGE_QUERY, (after_id if after_id is not None else -1, limit),
+                                    on_done=callback, on_error=failed)
+
     def show_authors(self):
         """Отображение списка всех авторов"""
         # Очистка рабочей области
@@ -328,13 +1159,12 @@ class LibrarySystem:
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         tree.pack(fill=tk.BOTH, expand=True)
 
-        # Получение данных из БД
-        self.cursor.execute('SELECT id, name, country, birth_year, death_year FROM authors')
-        authors = self.cursor.fetchall()
+        # Получение данных из БД и заполнение таблицы по готовности
+        def fill(authors):
+            for author in authors:
+                tree.insert('', tk.END, values=author)
 
-        # Заполнение таблицы данными
-        for author in authors:
-            tree.insert('', tk.END, values=author)
+        self.executor.fetch_all(AUTHORS_LIST_QUERY, on_done=fill)
 
         # Добавление кнопок
         button_frame = ttk.Frame(authors_frame)
@@ -357,9 +1187,10 @@ class LibrarySystem:
         author_id = tree.item(selected_item, "values")[0]
 
         # Получение данных автора
-        self.cursor.execute('SELECT name, country, birth_year, death_year FROM authors WHERE id = ?', (author_id,))
-        author = self.cursor.fetchone()
+        self.executor.fetch_one(AUTHOR_BY_ID_QUERY, (author_id,), on_done=self.save_author_json)
 
+    def save_author_json(self, author):
+        """Сохранение данных автора в файл JSON"""
         if not author:
             messagebox.showerror("Ошибка", "Автор не найден")
             return
@@ -398,9 +1229,10 @@ class LibrarySystem:
         author_id = tree.item(selected_item, "values")[0]
 
         # Получение данных автора
-        self.cursor.execute('SELECT name, country, birth_year, death_year FROM authors WHERE id = ?', (author_id,))
-        author = self.cursor.fetchone()
+        self.executor.fetch_one(AUTHOR_BY_ID_QUERY, (author_id,), on_done=self.save_author_xml)
 
+    def save_author_xml(self, author):
+        """Сохранение данных автора в файл XML"""
         if not author:
             messagebox.showerror("Ошибка", "Автор не найден")
             return
@@ -459,16 +1291,16 @@ class LibrarySystem:
         # Выбор автора
         ttk.Label(book_frame, text="Автор:").grid(row=1, column=0, sticky=tk.W, pady=5)
 
-        # Получение списка авторов из БД
-        self.cursor.execute('SELECT id, name FROM authors')
-        authors = self.cursor.fetchall()
-
-        # Создание комбобокса с авторами
+        # Создание комбобокса с авторами (список загружается из БД в фоне)
         author_var = tk.StringVar()
         author_combo = ttk.Combobox(book_frame, textvariable=author_var, width=30)
-        author_combo['values'] = [f"{author[0]}: {author[1]}" for author in authors]
         author_combo.grid(row=1, column=1, pady=5)
 
+        def fill_authors(authors):
+            author_combo['values'] = [f"{author[0]}: {author[1]}" for author in authors]
+
+        self.executor.fetch_all(AUTHOR_CHOICES_QUERY, on_done=fill_authors)
+
         # Поля для ввода данных о книге
         ttk.Label(book_frame, text="Название:").grid(row=2, column=0, sticky=tk.W, pady=5)
         title_entry = ttk.Entry(book_frame, width=30)
@@ -509,19 +1341,19 @@ class LibrarySystem:
             author_id = int(author.split(':')[0]) if author else None
             pages = int(pages) if pages else None
             year = int(year) if year else None
+        except ValueError:
+            messagebox.showerror("Ошибка", "Проверьте правильность ввода числовых значений")
+            return
 
-            self.cursor.execute(
-                "INSERT INTO books (author_id, title, pages, publisher, publication_year) VALUES (?, ?, ?, ?, ?)",
-                (author_id, title, pages, publisher, year)
-            )
-            self.conn.commit()
-
+        def added(_):
             messagebox.showinfo("Успех", "Книга успешно добавлена")
             self.show_books()
-        except ValueError:
-            messagebox.showerror("Ошибка", "Проверьте правильность ввода числовых значений")
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось добавить книгу: {str(e)}")
+
+        self.executor.execute(
+            "INSERT INTO books (author_id, title, pages, publisher, publication_year) VALUES (?, ?, ?, ?, ?)",
+            (author_id, title, pages, publisher, year), on_done=added,
+            on_error=lambda e: messagebox.showerror("Ошибка", f"Не удалось добавить книгу: {str(e)}")
+        )
 
     def show_add_author(self):
         """Отображение формы добавления нового автора"""
@@ -573,19 +1405,19 @@ class LibrarySystem:
         try:
             birth_year = int(birth_year) if birth_year else None
             death_year = int(death_year) if death_year else None
+        except ValueError:
+            messagebox.showerror("Ошибка", "Проверьте правильность ввода годов жизни")
+            return
 
-            self.cursor.execute(
-                "INSERT INTO authors (name, country, birth_year, death_year) VALUES (?, ?, ?, ?)",
-                (name, country, birth_year, death_year)
-            )
-            self.conn.commit()
-
+        def added(_):
             messagebox.showinfo("Успех", "Автор успешно добавлен")
             self.show_authors()
-        except ValueError:
-            messagebox.showerror("Ошибка", "Проверьте правильность ввода годов жизни")
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось добавить автора: {str(e)}")
+
+        self.executor.execute(
+            "INSERT INTO authors (name, country, birth_year, death_year) VALUES (?, ?, ?, ?)",
+            (name, country, birth_year, death_year), on_done=added,
+            on_error=lambda e: messagebox.showerror("Ошибка", f"Не удалось добавить автора: {str(e)}")
+        )
 
     def show_import_author(self):
         """Отображение формы импорта автора из файла"""
@@ -659,86 +1491,61 @@ class LibrarySystem:
             else:
                 messagebox.showerror("Ошибка", "Неподдерживаемый формат файла")
                 return
-
-            if author_data:
-                name = author_data.get('name')
-                country = author_data.get('country')
-                birth_year = author_data.get('birth_year')
-                death_year = author_data.get('death_year')
-
-                # Добавление автора в БД
-                self.cursor.execute(
-                    "INSERT INTO authors (name, country, birth_year, death_year) VALUES (?, ?, ?, ?)",
-                    (name, country, birth_year, death_year)
-                )
-                self.conn.commit()
-
-                messagebox.showinfo("Успех", "Автор успешно импортирован")
-                self.show_authors()
         except Exception as e:
             messagebox.showerror("Ошибка", f"Не удалось импортировать автора: {str(e)}")
+            return
 
-    def parse_author_from_json(self, file_path):
-        """Парсинг данных автора из JSON файла"""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-
-        author_data = {
-            'name': data.get('name'),
-            'country': data.get('country'),
-            'birth_year': None,
-            'death_year': None
-        }
-
-        # Обработка годов жизни
-        years = data.get('years', [])
-        if len(years) >= 2:
-            author_data['birth_year'] = years[0]
-            author_data['death_year'] = years[1]
+        if author_data:
+            name = author_data.get('name')
+            country = author_data.get('country')
+            birth_year = author_data.get('birth_year')
+            death_year = author_data.get('death_year')
 
-        return author_data
+            def imported(_):
+                messagebox.showinfo("Успех", "Автор успешно импортирован")
+                self.show_authors()
 
-    def parse_author_from_xml(self, file_path):
-        """Парсинг данных автора из XML файла"""
-        tree = ET.parse(file_path)
-        root = tree.getroot()
+            # Добавление автора в БД
+            self.executor.execute(
+                "INSERT INTO authors (name, country, birth_year, death_year) VALUES (?, ?, ?, ?)",
+                (name, country, birth_year, death_year), on_done=imported,
+                on_error=lambda e: messagebox.showerror("Ошибка", f"Не удалось импортировать автора: {str(e)}")
+            )
 
-        author_data = {
-            'name': None,
-            'country': None,
-            'birth_year': None,
-            'death_year': None
-        }
+    def bulk_import_directory(self):
+        """Массовый импорт авторов и книг из выбранной папки с файлами JSON/XML"""
+        directory = filedialog.askdirectory(title="Выберите папку с файлами авторов")
+        if not directory:
+            return
 
-        # Получение имени автора
-        name_elem = root.find('name')
-        if name_elem is not None and name_elem.text:
-            author_data['name'] = name_elem.text
+        errors = []
 
-        # Получение страны автора
-        country_elem = root.find('country')
-        if country_elem is not None and country_elem.text:
-            author_data['country'] = country_elem.text
+        def imported(stats):
+            # Последняя строка журнала - итоговая статистика импорта
+            messagebox.showinfo("Успех", errors.pop())
+            if stats['errors']:
+                messagebox.showerror("Ошибка", "\n".join(errors[:20]))
+            self.show_authors()
 
-        # Получение годов жизни
-        years_elem = root.find('years')
-        if years_elem is not None:
-            if 'born' in years_elem.attrib:
-                try:
-                    author_data['birth_year'] = int(years_elem.attrib['born'])
-                except ValueError:
-                    pass
+        # Импорт выполняется в потоке БД, журнал читается только после его завершения
+        self.executor.submit(lambda conn: bulk_import(conn, directory, log=errors.append), on_done=imported,
+                             on_error=lambda e: messagebox.showerror("Ошибка", f"Не удалось выполнить импорт: {str(e)}"),
+                             cancellable=False)
 
-            if 'died' in years_elem.attrib:
-                try:
-                    author_data['death_year'] = int(years_elem.attrib['died'])
-                except ValueError:
-                    pass
+    def parse_author_from_json(self, file_path):
+        """Парсинг данных автора из JSON файла"""
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return author_from_json(json.load(f))
 
-        return author_data
+    def parse_author_from_xml(self, file_path):
+        """Парсинг данных автора из XML файла"""
+        return author_from_xml(ET.parse(file_path).getroot())
 
     def clear_workspace(self):
         """Очистка рабочей области, сохраняя меню"""
+        # Результаты запросов закрываемого экрана больше не нужны
+        self.executor.cancel_pending()
+
         # Сохраняем главное меню
         menu = self.root.winfo_children()[0] if self.root.winfo_children() and isinstance(self.root.winfo_children()[0],
                                                                                           tk.Menu) else None
@@ -752,9 +1559,94 @@ class LibrarySystem:
         """Запуск приложения"""
         self.root.mainloop()
 
-        # Закрытие соединения с БД при выходе
-        if self.conn:
-            self.conn.close()
-
-app = LibrarySystem()
-app.run()
+        # Остановка потока БД и закрытие его соединения при выходе
+        if self.executor:
+            self.executor.close()
+
+def build_parser():
+    """Создание парсера аргументов командной строки"""
+    parser = argparse.ArgumentParser(description='Библиотечная информационная система (SQLite)')
+    parser.add_argument('--db', default='library.db', help='Путь к файлу БД')
+    parser.add_argument('--profile', choices=sorted(PRAGMA_PROFILES), default=DEFAULT_PRAGMA_PROFILE,
+                        help='Профиль настроек соединения с БД')
+    parser.add_argument('--pragma', action='append', type=parse_pragma_override, default=[], metavar='NAME=VALUE',
+                        help='Переопределение PRAGMA профиля (можно указать несколько раз)')
+    parser.add_argument('--check-settings', action='store_true',
+                        help='Вывести действующие настройки соединения с БД и выйти')
+    parser.add_argument('--explain-queries', action='store_true',
+                        help='Вывести планы запросов экранов (EXPLAIN QUERY PLAN) и выйти')
+    parser.add_argument('--import', dest='import_source', metavar='PATH',
+                        help='Массовый импорт авторов и книг из каталога JSON/XML, JSONL-дампа или XML-дампа')
+    parser.add_argument('--batch-size', type=int, default=5000,
+                        help='Количество авторов в одной транзакции импорта')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Количество процессов для разбора файлов (по умолчанию - по числу ядер)')
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    overrides = dict(args.pragma)
+
+    if args.check_settings:
+        conn, pragmas = connect_database(args.db, args.profile, overrides)
+        try:
+            report = check_database_settings(conn, pragmas)
+        finally:
+            conn.close()
+        print_database_settings(report)
+        return 0 if all(matches for *_, matches in report) else 1
+
+    if args.explain_queries:
+        if not os.path.isfile(args.db):
+            print(f"Ошибка: БД {args.db} не найдена")
+            return 1
+
+        # Диагностика ничего не меняет: БД открывается только для чтения, без миграций и ANALYZE
+        conn = sqlite3.connect(Path(args.db).resolve().as_uri() + '?mode=ro', uri=True)
+        try:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            latest = SCHEMA_MIGRATIONS[-1][0]
+            print(f"Версия схемы: {version}")
+            if version < latest:
+                print(f"Внимание: схема устарела (актуальная версия {latest}), индексы могут отсутствовать. "
+                      f"Миграции применяются при запуске приложения")
+            print()
+            scans = explain_screen_queries(conn)
+        except sqlite3.Error as e:
+            print(f"Ошибка при построении планов запросов: {e}")
+            return 1
+        finally:
+            conn.close()
+        print(f"Шагов плана с полным просмотром таблицы: {scans}")
+        return 1 if scans else 0
+
+    if args.import_source:
+        if not os.path.exists(args.import_source):
+            print(f"Ошибка: путь {args.import_source} не найден")
+            return 1
+        if args.batch_size < 1:
+            print("Ошибка: размер пачки должен быть не меньше 1")
+            return 1
+        if args.workers is not None and args.workers < 1:
+            print("Ошибка: количество процессов должно быть не меньше 1")
+            return 1
+
+        conn, _ = connect_database(args.db, args.profile, overrides)
+        try:
+            migrate_database(conn)
+            bulk_import(conn, args.import_source, args.batch_size, args.workers)
+        except ValueError as e:
+            print(f"Ошибка: {e}")
+            return 1
+        finally:
+            conn.close()
+        return 0
+
+    app = LibrarySystem(args.db, args.profile, overrides)
+    app.run()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())